@@ -1,4 +1,4 @@
-from UDPComms import Publisher, Subscriber, timeout
+from UDPComms import Publisher, Subscriber, LocalPublisher, LocalSubscriber, timeout, JOYSTICK_SCHEMA
 from PS4Joystick import Joystick
 
 import time
@@ -8,9 +8,15 @@ import time
 ## Configurable ##
 MESSAGE_RATE = 20
 PUPPER_COLOR = {"red":0, "blue":0, "green":255}
+BINARY_MESSAGES = True  # send the compact JOYSTICK_SCHEMA layout instead of msgpack
+LOCAL_TRANSPORT = False  # pass messages through shared memory, needs joystick_transport = "shm" on the robot
 
-joystick_pub = Publisher(8830,65530)
-joystick_subcriber = Subscriber(8840, timeout=0.01)
+if LOCAL_TRANSPORT:
+    joystick_pub = LocalPublisher(8830,65530, schema=JOYSTICK_SCHEMA if BINARY_MESSAGES else None)
+    joystick_subcriber = LocalSubscriber(8840, timeout=0.01)
+else:
+    joystick_pub = Publisher(8830,65530, schema=JOYSTICK_SCHEMA if BINARY_MESSAGES else None, sequence=True)
+    joystick_subcriber = Subscriber(8840, timeout=0.01)
 joystick = Joystick()
 joystick.led_color(**PUPPER_COLOR)
 
@@ -0,0 +1,109 @@
+"""Benchmarks of the controller: kinematics, gait and a full Controller.run in each behavior state"""
+import itertools
+
+import numpy as np
+from transforms3d.euler import euler2mat
+
+from pupper.Config import Configuration
+from pupper.Kinematics import four_legs_inverse_kinematics
+from pupper.KinematicsTable import KinematicsTable
+from pupper.MovementGroup import MovementLib
+from src.Command import Command
+from src.Controller import Controller
+from src.MovementScheme import MovementScheme
+from src.Rotations import CachedRotation, euler_matrix, quat_to_euler
+from src.State import BehaviorState, State
+
+
+def make_controller():
+    config = Configuration()
+    controller = Controller(config, four_legs_inverse_kinematics)
+    state = State()
+    state.quat_orientation = np.array([1, 0, 0, 0])
+    command = Command()
+    command.horizontal_velocity = np.array([0.1, 0.05])
+    command.yaw_rate = 0.2
+    return (config, controller, state, command)
+
+
+def inverse_kinematics():
+    config = Configuration()
+    foot_locations = config.default_stance + np.array([0.01, -0.005, config.default_z_ref])[:, np.newaxis]
+    joint_angles = np.zeros((3, 4))
+    return lambda: four_legs_inverse_kinematics(foot_locations, config, out=joint_angles)
+
+
+def table_inverse_kinematics():
+    config = Configuration()
+    ik_table = KinematicsTable.build(config)
+    foot_locations = config.default_stance + np.array([0.01, -0.005, config.default_z_ref])[:, np.newaxis]
+    joint_angles = np.zeros((3, 4))
+    return lambda: ik_table.inverse_kinematics(foot_locations, config, out=joint_angles)
+
+
+def step_gait():
+    (config, controller, state, command) = make_controller()
+
+    def step():
+        controller.step_gait(state, command)
+        state.ticks += 1
+
+    return step
+
+
+def controller_run(behavior_state):
+    def benchmark():
+        (config, controller, state, command) = make_controller()
+        movement_ctl = MovementScheme(MovementLib)
+        location = movement_ctl.getMovemenLegsLocation()
+        attitude = movement_ctl.getMovemenAttitude()
+        speed = movement_ctl.getMovemenSpeed()
+
+        def run():
+            state.behavior_state = behavior_state
+            controller.run(state, command, location, attitude, speed)
+
+        return run
+
+    return benchmark
+
+
+def rotation_matrix():
+    matrix = np.zeros((3, 3))
+    return lambda: euler_matrix(0.1, -0.05, 0.3, out=matrix)
+
+
+def transforms3d_rotation_matrix():
+    """Reference for euler_matrix, the Euler angle conversion the controller used before"""
+    return lambda: euler2mat(0.1, -0.05, 0.3)
+
+
+def cached_rotation(angles):
+    """CachedRotation.update alternating between the given (roll, pitch, yaw) tuples"""
+
+    def benchmark():
+        rotation = CachedRotation()
+        angle_cycle = itertools.cycle(angles)
+        return lambda: rotation.update(*next(angle_cycle))
+
+    return benchmark
+
+
+def quaternion_to_euler():
+    quat = np.array([0.99, 0.05, -0.03, 0.1])
+    return lambda: quat_to_euler(quat)
+
+
+BENCHMARKS = {
+    "four_legs_inverse_kinematics": inverse_kinematics,
+    "KinematicsTable.inverse_kinematics": table_inverse_kinematics,
+    "Controller.step_gait": step_gait,
+    "euler_matrix": rotation_matrix,
+    "transforms3d euler2mat": transforms3d_rotation_matrix,
+    "CachedRotation.update, same angles": cached_rotation([(0.1, -0.05, 0.3)]),
+    "CachedRotation.update, changing angles": cached_rotation([(0.1, -0.05, 0.3), (0.2, -0.05, 0.3)]),
+    "CachedRotation.update, changing yaw": cached_rotation([(0.0, 0.0, 0.3), (0.0, 0.0, 0.4)]),
+    "quat_to_euler": quaternion_to_euler,
+}
+for behavior_state in BehaviorState:
+    BENCHMARKS["Controller.run " + behavior_state.name] = controller_run(behavior_state)
@@ -0,0 +1,147 @@
+"""Benchmarks of the input and output paths: joystick commands, movement scheme, display and servo writes"""
+import os
+import tempfile
+
+import numpy as np
+import UDPComms
+
+from pupper.Config import Configuration, PWMParams, ServoParams
+from pupper.HardwareInterface import HardwareInterface, PWMWriter, send_servo_commands
+from pupper.MovementGroup import MovementLib
+from src.JoystickInterface import JoystickInterface
+from src.MovementScheme import MovementScheme
+from src.Simulation import NEUTRAL_JOYSTICK_MESSAGE, NullPublisher, ScriptedJoystick, default_script
+from src.State import State
+
+
+# Holds the fake sysfs directories, removed with everything in it when the benchmarks exit
+sysfs_folder = None
+
+
+def fake_sysfs(pwm_params):
+    """Creates a directory of empty pwmN/duty_cycle files standing in for the pwm sysfs nodes"""
+    global sysfs_folder
+    if sysfs_folder is None:
+        sysfs_folder = tempfile.TemporaryDirectory(prefix="pupper_pwm_")
+    root = tempfile.mkdtemp(dir=sysfs_folder.name)
+    for pin in np.ravel(pwm_params.pins):
+        os.makedirs(os.path.join(root, "pwm" + str(pin)))
+        open(os.path.join(root, "pwm" + str(pin), "duty_cycle"), "w").close()
+    return root
+
+
+def get_command():
+    (events, period) = default_script()
+    joystick_interface = JoystickInterface(
+        Configuration(), udp_handle=ScriptedJoystick(events, period), udp_publisher=NullPublisher()
+    )
+    state = State()
+    return lambda: joystick_interface.get_command(state)
+
+
+def run_movement_scheme():
+    movement_ctl = MovementScheme(MovementLib)
+    return lambda: movement_ctl.runMovementScheme(False)
+
+
+def image_to_data():
+    from PIL import Image
+    from Mangdang.LCD.ST7789 import image_to_data
+
+    image = Image.new("RGB", (320, 240), (40, 120, 200))
+    return lambda: image_to_data(image)
+
+
+def servo_commands():
+    pwm_params = PWMParams()
+    pwm_writer = PWMWriter(pwm_params, fake_sysfs(pwm_params))
+    servo_params = ServoParams()
+    joint_angles = np.array([[0.0, 0.0, 0.0, 0.0], [0.8, 0.8, 0.8, 0.8], [-0.8, -0.8, -0.8, -0.8]])
+    return lambda: send_servo_commands(pwm_writer, servo_params, joint_angles)
+
+
+def set_actuator_positions():
+    pwm_params = PWMParams()
+    hardware_interface = HardwareInterface(pwm_root=fake_sysfs(pwm_params))
+    joint_angles = np.array([[0.0, 0.0, 0.0, 0.0], [0.8, 0.8, 0.8, 0.8], [-0.8, -0.8, -0.8, -0.8]])
+    sign = np.array([1.0])
+
+    def write():
+        # Alternate between two poses so every channel changes and is written
+        sign[0] = -sign[0]
+        joint_angles[0] = 0.05 * sign[0]
+        hardware_interface.set_actuator_postions(joint_angles)
+
+    return write
+
+
+def subscriber_get(queued, unpacker=False, schema=None):
+    """Publishes joystick messages to a local Subscriber and reads the latest one with get"""
+
+    def benchmark():
+        subscriber = UDPComms.Subscriber(0, timeout=1.0, unpacker=unpacker)
+        port = subscriber.sock.getsockname()[1]
+        publisher = UDPComms.Publisher(port, 0, schema=schema)
+
+        def get():
+            for _ in range(queued):
+                publisher.send(NEUTRAL_JOYSTICK_MESSAGE)
+            subscriber.get()
+
+        return get
+
+    return benchmark
+
+
+def subscriber_get_list(queued, batch_size=1):
+    """Publishes joystick messages to a local Subscriber and reads all of them with get_list"""
+
+    def benchmark():
+        subscriber = UDPComms.Subscriber(0, timeout=1.0)
+        port = subscriber.sock.getsockname()[1]
+        publisher = UDPComms.Publisher(port, 0, batch_size=batch_size)
+
+        def get_list():
+            for _ in range(queued):
+                publisher.send(NEUTRAL_JOYSTICK_MESSAGE)
+            subscriber.get_list()
+
+        return get_list
+
+    return benchmark
+
+
+def local_subscriber_get(schema=None):
+    """Publishes joystick messages through shared memory and reads the latest one with get"""
+
+    def benchmark():
+        port = 60000 + os.getpid() % 5000
+        publisher = UDPComms.LocalPublisher(port, schema=schema)
+        subscriber = UDPComms.LocalSubscriber(port, timeout=1.0)
+        publisher.send(NEUTRAL_JOYSTICK_MESSAGE)
+        subscriber.get()
+
+        def get():
+            publisher.send(NEUTRAL_JOYSTICK_MESSAGE)
+            subscriber.get()
+
+        return get
+
+    return benchmark
+
+
+BENCHMARKS = {
+    "JoystickInterface.get_command": get_command,
+    "MovementScheme.runMovementScheme": run_movement_scheme,
+    "image_to_data": image_to_data,
+    "send_servo_commands": servo_commands,
+    "HardwareInterface.set_actuator_postions": set_actuator_positions,
+    "UDPComms send + Subscriber.get": subscriber_get(1),
+    "UDPComms send + Subscriber.get, Unpacker": subscriber_get(1, unpacker=True),
+    "UDPComms 10 sends + Subscriber.get": subscriber_get(10),
+    "UDPComms send + Subscriber.get, binary": subscriber_get(1, schema=UDPComms.JOYSTICK_SCHEMA),
+    "UDPComms 10 sends + Subscriber.get_list": subscriber_get_list(10),
+    "UDPComms 10 sends + Subscriber.get_list, batched": subscriber_get_list(10, batch_size=10),
+    "UDPComms local send + LocalSubscriber.get": local_subscriber_get(),
+    "UDPComms local send + LocalSubscriber.get, binary": local_subscriber_get(UDPComms.JOYSTICK_SCHEMA),
+}
@@ -0,0 +1,113 @@
+"""Times the control path and compares it to the stored baseline of this machine type.
+
+Each bench_*.py module in this directory has a BENCHMARKS dict mapping a name to a function
+that does the setup and returns the callable to time. The time of a benchmark is the fastest
+of several repeats, per call.
+
+    python3 benchmarks/run_benchmarks.py                  # compare to baseline.json, exit 1 on regressions
+    python3 benchmarks/run_benchmarks.py --save-baseline  # record the baseline of this machine type
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import timeit
+
+# Same module layout as on the robot, with the repository in place of /home/ubuntu/Robotics/QuadrupedRobot
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+package_folder = os.path.dirname(benchmarks_folder)
+repository = os.path.dirname(package_folder)
+sys.path.insert(0, package_folder)
+sys.path.append(repository)
+sys.path.extend(
+    [
+        os.path.join(root, name)
+        for root, dirs, _ in os.walk(repository)
+        for name in dirs
+        if not name.startswith(".") and ".git" not in root
+    ]
+)
+
+BASELINE_FILE = os.path.join(benchmarks_folder, "baseline.json")
+MODULES = ("bench_control", "bench_io")
+
+
+def machine():
+    """Key of the baselines of this kind of machine"""
+    return platform.machine() + " python" + ".".join(platform.python_version_tuple()[:2])
+
+
+def time_benchmark(factory, repeat=9, min_time=0.1):
+    """Returns the fastest time per call [s] of the callable made by factory"""
+    timer = timeit.Timer(factory())
+    (number, _) = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def collect(name_filter=None):
+    benchmarks = {}
+    for module_name in MODULES:
+        module = importlib.import_module(module_name)
+        for name, factory in module.BENCHMARKS.items():
+            if name_filter is None or name_filter in name:
+                benchmarks[name] = factory
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Control path benchmarks")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown over the baseline, 0.25 is 25%%")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as this machine's baseline")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as baseline_f:
+            baselines = json.load(baseline_f)
+    baseline = baselines.get(machine(), {})
+    if not baseline and not args.save_baseline:
+        print("No baseline for " + machine() + ", record one with --save-baseline")
+
+    results = {}
+    regressions = []
+    for name, factory in collect(args.filter).items():
+        try:
+            seconds = time_benchmark(factory)
+        except ImportError as error:
+            print("{:<45} skipped, {}".format(name, error))
+            continue
+        results[name] = seconds
+        line = "{:<45} {:10.2f} us".format(name, seconds * 1e6)
+        if name in baseline:
+            change = seconds / baseline[name] - 1
+            line += "  {:+7.1%} vs baseline {:.2f} us".format(change, baseline[name] * 1e6)
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as output_f:
+            json.dump({machine(): results}, output_f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        baselines.setdefault(machine(), {}).update(results)
+        with open(BASELINE_FILE, "w") as baseline_f:
+            json.dump(baselines, baseline_f, indent=2, sort_keys=True)
+            baseline_f.write("\n")
+        print("Saved the baseline of " + machine() + " to " + BASELINE_FILE)
+    elif regressions:
+        print(
+            "{} benchmarks are more than {:.0%} slower than the baseline: {}".format(
+                len(regressions), args.threshold, ", ".join(regressions)
+            )
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import hashlib
 import numpy as np
 from pupper.ServoCalibration import MICROS_PER_RAD
 from pupper.HardwareConfig import PS4_COLOR, PS4_DEACTIVATED_COLOR
@@ -9,6 +10,12 @@ class PWMParams:
         self.pins = np.array([[15, 12, 9, 6], [14, 11, 8, 5], [13, 10, 7, 4]])
         self.range = 4096  ## ADC 12 bits
         self.freq = 250  ## PWM freq
+        self.sysfs_root = "/sys/class/pwm/pwmchip0"  ## pwm kernel nodes
+        self.write_deadband = 0  ## duty cycle changes [ns] up to this size are not written to the servos
+        self.output_thread = False  ## write to the servos from a background thread
+        self.backend = "sysfs"  ## "sysfs" writes through the pwm kernel nodes, "i2c" writes the PCA9685 registers directly
+        self.i2c_bus = 1  ## /dev/i2c-N the PCA9685 is on, i2c-4 is the MAX17205 fuel gauge
+        self.i2c_address = 0x40
 
 
 class ServoParams:
@@ -16,8 +23,12 @@ class ServoParams:
         self.neutral_position_pwm = 1500  # Middle position
         self.micros_per_rad = MICROS_PER_RAD  # Must be calibrated
 
-        with open("/home/ubuntu/.hw_version", "r") as hw_f:
-            hw_version = hw_f.readline()
+        try:
+            with open("/home/ubuntu/.hw_version", "r") as hw_f:
+                hw_version = hw_f.readline()
+        except OSError:
+            # Not on the robot, e.g. in simulation. The calibration falls back to the defaults below.
+            hw_version = ""
 
         if hw_version == 'P1\n':
             nv_file = "/home/ubuntu/.nv_fle"
@@ -41,12 +52,85 @@ class ServoParams:
             )
         self.neutral_angle_degrees = matrix
         self.servo_multipliers = np.array(
-            [[1, 1, -1, -1], [-1, 1, -1, 1], [-1, 1, -1, 1]]
+            [[1, 1, -1, -1], [-1, 1, -1, 1], [-1, 1, -1, 1]], dtype=float
         )
 
+    @property
+    def neutral_angle_degrees(self):
+        return self.__neutral_angle_degrees
+
+    @neutral_angle_degrees.setter
+    def neutral_angle_degrees(self, degrees):
+        self.__neutral_angle_degrees = degrees
+        # Converted once here instead of on every servo update
+        self.__neutral_angles = degrees * np.pi / 180.0  # Convert to radians
+
     @property
     def neutral_angles(self):
-        return self.neutral_angle_degrees * np.pi / 180.0  # Convert to radians
+        return self.__neutral_angles
+
+
+class CompiledConfiguration:
+    """Read-only snapshot of the constants and arrays derived from a Configuration.
+
+    The derived properties of Configuration rebuild numpy arrays on every access. This object
+    computes them once so the control loop and kinematics can index them directly. Do not build
+    it yourself, use Configuration.compiled, which rebuilds it after a parameter changes.
+    """
+
+    def __init__(self, config):
+        ######################## GEOMETRY ######################
+        self.LEG_L1_SQ = config.LEG_L1 ** 2
+        self.LEG_L2_SQ = config.LEG_L2 ** 2
+        self.LEG_L1_SQ_PLUS_L2_SQ = config.LEG_L1 ** 2 + config.LEG_L2 ** 2
+        self.TWO_LEG_L1 = 2 * config.LEG_L1
+        self.TWO_LEG_L1_L2 = 2 * config.LEG_L1 * config.LEG_L2
+        self.ABDUCTION_OFFSET_SQ = config.ABDUCTION_OFFSET ** 2
+        self.LEG_ORIGINS = self._frozen_array(config.LEG_ORIGINS)
+        self.ABDUCTION_OFFSETS = self._frozen_array(config.ABDUCTION_OFFSETS)
+
+        #################### STANCE ####################
+        self.default_stance = self._frozen_array(config.default_stance)
+
+        ########################### GAIT ####################
+        self.overlap_ticks = config.overlap_ticks
+        self.swing_ticks = config.swing_ticks
+        self.stance_ticks = config.stance_ticks
+        self.phase_ticks = self._frozen_array(config.phase_ticks)
+        self.phase_length = config.phase_length
+
+        ################### IK TABLE ####################
+        self.geometry_hash = self._geometry_hash(config)
+
+        self._frozen = True
+
+    @staticmethod
+    def _geometry_hash(config):
+        """Hex digest of every parameter the inverse kinematics table depends on"""
+        digest = hashlib.sha1()
+        for value in (
+            config.LEG_L1,
+            config.LEG_L2,
+            config.ABDUCTION_OFFSET,
+            config.LEG_ORIGINS,
+            config.ABDUCTION_OFFSETS,
+            config.default_stance,
+            config.ik_table_box,
+            config.ik_table_resolution,
+        ):
+            digest.update(np.ascontiguousarray(value, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _frozen_array(array):
+        array = np.array(array, dtype=float)
+        array.setflags(write=False)
+        return array
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError("CompiledConfiguration is read-only, change the Configuration instead")
+        super().__setattr__(name, value)
 
 
 class Configuration:
@@ -60,6 +144,11 @@ class Configuration:
         self.max_y_velocity = 0.20
         self.max_yaw_rate = 2
         self.max_pitch = 20.0 * np.pi / 180.0
+        self.max_command_age = 0.2  # joystick messages sent longer ago than this are ignored [s]
+        # "udp", or "shm" for a joystick daemon on the robot itself, which then passes messages
+        # through shared memory. The daemon has to use the same transport.
+        self.joystick_transport = "udp"
+        self.shutdown_ticks = 200  # ticks the shutdown button is held before the robot shuts down
 
         #################### MOVEMENT PARAMS ####################
         self.z_time_constant = 0.02
@@ -90,6 +179,7 @@ class Configuration:
 
         #################### GAIT #######################
         self.dt = 0.015
+        self.loop_spin_time = 0.0003  # busy-wait this long before each control loop deadline, 0 to only sleep
         self.num_phases = 4
         self.contact_phases = np.array(
             [[1, 1, 1, 0], [1, 0, 1, 1], [1, 0, 1, 1], [1, 1, 1, 0]]
@@ -100,6 +190,9 @@ class Configuration:
         self.swing_time = (
             0.1  # duration of the phase when only two feet are on the ground
         )
+        # Gaits R2 cycles through, see src/Gaits.py. Pace, bound and pronk lift both feet of a
+        # side or of an end at once, which the stance and swing controllers cannot balance.
+        self.gait_cycle = ("trot", "walk")
 
         ######################## GEOMETRY ######################
         self.LEG_FB = 0.059  # front-back distance from center line to leg axis
@@ -135,6 +228,20 @@ class Configuration:
             ]
         )
 
+        ################### IK TABLE ####################
+        self.use_ik_table = False  # answer IK from a precomputed grid, see pupper/KinematicsTable.py
+        self.ik_table_file = "/home/ubuntu/.pupper_ik_table.npy"
+        self.ik_table_resolution = 0.002  # grid spacing [m]
+        # Workspace covered by the table for each foot: x and y relative to the default stance, z absolute [m]
+        self.ik_table_box = np.array([[-0.03, 0.03], [-0.025, 0.025], [-0.09, -0.035]])
+        self.ik_table_max_error = 0.01  # maximum interpolation error [rad]
+
+        ################### TELEMETRY ####################
+        self.telemetry_enabled = False  # time each stage of the control loop, see src/Telemetry.py
+        self.telemetry_capacity = 4096  # number of ticks kept
+        self.telemetry_address = ("127.0.0.1", 8850)  # local UDP port or Unix socket path for queries, None for no server
+        self.telemetry_dump_file = "/tmp/pupper_telemetry.npy"  # latest ticks are saved here on SIGUSR1
+
         ################### INERTIAL ####################
         self.FRAME_MASS = 0.200  # kg
         self.MODULE_MASS = 0.020  # kg
@@ -155,6 +262,22 @@ class Configuration:
         leg_y = leg_x
         self.LEG_INERTIA = (leg_x, leg_y, leg_z)
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        # Any parameter change makes the compiled constants stale
+        self.__dict__["_compiled"] = None
+
+    @property
+    def compiled(self):
+        """Derived constants and arrays, rebuilt on first access after a parameter changed"""
+        if self._compiled is None:
+            self.__dict__["_compiled"] = CompiledConfiguration(self)
+        return self._compiled
+
+    def invalidate(self):
+        """Drop the compiled constants after modifying an array parameter in place, e.g. LEG_ORIGINS"""
+        self.__dict__["_compiled"] = None
+
     @property
     def default_stance(self):
         return np.array(
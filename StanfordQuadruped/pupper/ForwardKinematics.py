@@ -0,0 +1,168 @@
+import numpy as np
+
+
+def four_legs_forward_kinematics(joint_angles, config, out=None):
+    """Find the body-relative foot positions corresponding to the given matrix of joint angles.
+
+    This is the inverse of four_legs_inverse_kinematics and uses the same geometry and angle
+    conventions. Any stack of matrices whose last two axes are (3,4) is accepted.
+
+    Parameters
+    ----------
+    joint_angles : numpy array (3,4)
+        Matrix of joint angles. Rows are abduction, hip and knee angles, each column corresponds to a separate leg.
+    config : Config object
+        Object of robot configuration parameters.
+    out : numpy array (3,4), optional
+        Preallocated array the foot positions are written into. A new array is allocated if None.
+
+    Returns
+    -------
+    numpy array (3,4)
+        Matrix of the body-frame foot positions.
+    """
+    joint_angles = np.asarray(joint_angles, dtype=float)
+    if out is None:
+        out = np.empty(joint_angles.shape)
+    abduction_angle = joint_angles[..., 0, :]
+    hip_angle = joint_angles[..., 1, :]
+    knee_angle = joint_angles[..., 2, :]
+
+    # Foot position in the leg plane: x is forward, d is along the tilted negative z axis
+    x = -config.LEG_L1 * np.sin(hip_angle) - config.LEG_L2 * np.sin(knee_angle)
+    d = config.LEG_L1 * np.cos(hip_angle) + config.LEG_L2 * np.cos(knee_angle)
+
+    # Rotate the leg plane about the ab/adduction axis and add the abduction offset
+    cos_abduction = np.cos(abduction_angle)
+    sin_abduction = np.sin(abduction_angle)
+    np.add(x, config.LEG_ORIGINS[0], out=out[..., 0, :])
+    np.add(
+        config.ABDUCTION_OFFSETS * cos_abduction + d * sin_abduction,
+        config.LEG_ORIGINS[1],
+        out=out[..., 1, :],
+    )
+    np.add(
+        config.ABDUCTION_OFFSETS * sin_abduction - d * cos_abduction,
+        config.LEG_ORIGINS[2],
+        out=out[..., 2, :],
+    )
+    return out
+
+
+def four_legs_jacobians(joint_angles, config, out=None):
+    """Find the analytic Jacobian of every foot position with respect to that leg's joint angles.
+
+    Parameters
+    ----------
+    joint_angles : numpy array (3,4)
+        Matrix of joint angles. Each column corresponds to a separate leg.
+    config : Config object
+        Object of robot configuration parameters.
+    out : numpy array (4,3,3), optional
+        Preallocated array the Jacobians are written into. A new array is allocated if None.
+
+    Returns
+    -------
+    numpy array (4,3,3)
+        out[i] is the 3x3 Jacobian d(x, y, z) / d(abduction, hip, knee) of leg i.
+    """
+    if out is None:
+        out = np.empty((4, 3, 3))
+    (abduction_angle, hip_angle, knee_angle) = joint_angles
+
+    cos_abduction = np.cos(abduction_angle)
+    sin_abduction = np.sin(abduction_angle)
+    L1_cos_hip = config.LEG_L1 * np.cos(hip_angle)
+    L1_sin_hip = config.LEG_L1 * np.sin(hip_angle)
+    L2_cos_knee = config.LEG_L2 * np.cos(knee_angle)
+    L2_sin_knee = config.LEG_L2 * np.sin(knee_angle)
+    d = L1_cos_hip + L2_cos_knee
+
+    out[:, 0, 0] = 0.0
+    out[:, 0, 1] = -L1_cos_hip
+    out[:, 0, 2] = -L2_cos_knee
+
+    out[:, 1, 0] = d * cos_abduction - config.ABDUCTION_OFFSETS * sin_abduction
+    out[:, 1, 1] = -L1_sin_hip * sin_abduction
+    out[:, 1, 2] = -L2_sin_knee * sin_abduction
+
+    out[:, 2, 0] = d * sin_abduction + config.ABDUCTION_OFFSETS * cos_abduction
+    out[:, 2, 1] = L1_sin_hip * cos_abduction
+    out[:, 2, 2] = L2_sin_knee * cos_abduction
+    return out
+
+
+def leg_jacobian(joint_angles, leg_index, config):
+    """Find the analytic 3x3 Jacobian of one foot position with respect to its joint angles.
+
+    Parameters
+    ----------
+    joint_angles : numpy array (3)
+        Abduction, hip and knee angle of the leg.
+    leg_index : int
+        Index of the leg. 0 is front-right, 1 is front-left, 2 is back-right, 3 is back-left.
+    config : Config object
+        Object of robot configuration parameters.
+
+    Returns
+    -------
+    numpy array (3,3)
+        Jacobian d(x, y, z) / d(abduction, hip, knee).
+    """
+    all_joint_angles = np.zeros((3, 4))
+    all_joint_angles[:, leg_index] = joint_angles
+    return four_legs_jacobians(all_joint_angles, config)[leg_index]
+
+
+def incremental_inverse_kinematics(r_body_foot, joint_angles, config, iterations=1):
+    """Refine a guess of the joint angles towards the given foot positions with Newton steps.
+
+    When the feet only move a little between timesteps, warm-starting from the previous
+    joint angles and taking one or two steps is enough, instead of a full closed-form solve.
+
+    Parameters
+    ----------
+    r_body_foot : numpy array (3,4)
+        Matrix of the desired body-frame foot positions.
+    joint_angles : numpy array (3,4)
+        Initial guess for the joint angles, e.g. the previous timestep's solution.
+    config : Config object
+        Object of robot configuration parameters.
+    iterations : int
+        Number of Newton steps to take.
+
+    Returns
+    -------
+    numpy array (3,4)
+        Matrix of refined joint angles.
+    """
+    joint_angles = np.array(joint_angles, dtype=float)
+    foot_locations = np.empty((3, 4))
+    jacobians = np.empty((4, 3, 3))
+    for _ in range(iterations):
+        four_legs_forward_kinematics(joint_angles, config, out=foot_locations)
+        four_legs_jacobians(joint_angles, config, out=jacobians)
+        error = (r_body_foot - foot_locations).T[:, :, np.newaxis]
+        joint_angles += np.linalg.solve(jacobians, error)[:, :, 0].T
+    return joint_angles
+
+
+def inverse_kinematics_error(r_body_foot, joint_angles, config):
+    """Find how far the feet of the given joint angles are from the desired foot positions.
+
+    Parameters
+    ----------
+    r_body_foot : numpy array (3,4)
+        Matrix of the desired body-frame foot positions.
+    joint_angles : numpy array (3,4)
+        Matrix of joint angles, e.g. the output of four_legs_inverse_kinematics.
+    config : Config object
+        Object of robot configuration parameters.
+
+    Returns
+    -------
+    numpy array (4)
+        Euclidean position error of each foot in meters.
+    """
+    foot_locations = four_legs_forward_kinematics(joint_angles, config)
+    return np.linalg.norm(foot_locations - r_body_foot, axis=0)
@@ -1,23 +1,297 @@
 import os
 import sys
+import threading
+import time
+from collections import deque
 
 sys.path.append("/home/ubuntu/Robotics/QuadrupedRobot/")
 sys.path.extend([os.path.join(root, name) for root, dirs, _ in os.walk("/home/ubuntu/Robotics/QuadrupedRobot") for name in dirs])
 from Mangdang import PWMController
 from pupper.Config import ServoParams, PWMParams
+from pupper.PCA9685 import PCA9685Writer
 #from __future__ import division
 import numpy as np
 
 class HardwareInterface:
-    def __init__(self):
+    def __init__(self, pwm_root=None, output_thread=None, pwm_writer=None):
+        """
+        Parameters
+        ----------
+        pwm_root : str, optional
+            Directory holding the pwmN/duty_cycle nodes, defaults to PWMParams.sysfs_root.
+        output_thread : bool, optional
+            Write to the servos from a background thread, see ServoOutputThread.
+            Defaults to PWMParams.output_thread.
+        pwm_writer : PWMWriter or PCA9685Writer, optional
+            Writer used for the servos. Defaults to the one selected by PWMParams.backend.
+        """
         self.pwm_params = PWMParams()
         self.servo_params = ServoParams()
+        if pwm_writer is None:
+            pwm_writer = make_pwm_writer(self.pwm_params, pwm_root)
+        self.pwm_writer = pwm_writer
+
+        # Last duty cycle written to each servo, starting far from any real value so
+        # the first update writes every channel
+        self.last_duty_cycles = np.full((3, 4), -(2 ** 31), dtype=np.int64)
+        self.duty_cycles = np.zeros((3, 4), dtype=np.int64)
+        self.duty_cycles_work = np.zeros((3, 4))
+        self.nan_angles = np.zeros((3, 4), dtype=bool)
+        self.duty_cycle_changes = np.zeros((3, 4), dtype=np.int64)
+        self.changed = np.zeros((3, 4), dtype=bool)
+
+        # Number of servo writes done and skipped because of the deadband
+        self.write_count = 0
+        self.skipped_write_count = 0
+
+        # Held while writing to the servos and updating last_duty_cycles, which the output
+        # thread and set_actuator_position may do at the same time
+        self.write_lock = threading.Lock()
+
+        if output_thread is None:
+            output_thread = self.pwm_params.output_thread
+        self.output_thread = None
+        if output_thread:
+            self.output_thread = ServoOutputThread(self.write_actuator_positions)
+            self.output_thread.start()
 
     def set_actuator_postions(self, joint_angles):
-        send_servo_commands(self.pwm_params, self.servo_params, joint_angles)
+        """Sends the joint angles to the servos, through the output thread if there is one"""
+        if self.output_thread is not None:
+            self.output_thread.put(joint_angles)
+        else:
+            self.write_actuator_positions(joint_angles)
+
+    def write_actuator_positions(self, joint_angles):
+        """Writes the duty cycles of the servos whose duty cycle moved more than pwm_params.write_deadband"""
+        with self.write_lock:
+            self._write_actuator_positions(joint_angles)
+
+    def _write_actuator_positions(self, joint_angles):
+        angles_to_duty_cycles(
+            joint_angles, self.servo_params, self.duty_cycles, self.duty_cycles_work, self.nan_angles
+        )
+        np.subtract(self.duty_cycles, self.last_duty_cycles, out=self.duty_cycle_changes)
+        np.abs(self.duty_cycle_changes, out=self.duty_cycle_changes)
+        # Python int operands make the ufunc allocate while resolving the loop, numpy ints do not
+        np.greater(self.duty_cycle_changes, np.int64(self.pwm_params.write_deadband), out=self.changed)
+
+        changed_count = int(np.count_nonzero(self.changed))
+        self.write_count += changed_count
+        self.skipped_write_count += 12 - changed_count
+        if changed_count == 12:
+            self.pwm_writer.write_all(self.duty_cycles)
+        elif changed_count > 0:
+            self.pwm_writer.write_all(self.duty_cycles, self.changed)
+        np.copyto(self.last_duty_cycles, self.duty_cycles, where=self.changed)
 
     def set_actuator_position(self, joint_angle, axis, leg):
-        send_servo_command(self.pwm_params, self.servo_params, joint_angle, axis, leg)
+        """Writes the angle of a single servo right away, between the frames of the output thread if there is one"""
+        with self.write_lock:
+            duty_cycle = send_servo_command(self.pwm_writer, self.servo_params, joint_angle, axis, leg)
+            self.last_duty_cycles[axis, leg] = duty_cycle
+            self.write_count += 1
+
+    def close(self):
+        if self.output_thread is not None:
+            self.output_thread.stop()
+        self.pwm_writer.close()
+
+
+class ServoFrame:
+    def __init__(self):
+        self.joint_angles = np.zeros((3, 4))
+        self.put_time = 0.0
+
+
+class ServoOutputThread(threading.Thread):
+    """Writes servo frames from a background thread so slow bus writes do not delay the control loop.
+
+    put() hands over the latest (3,4) joint angle frame through a single-slot mailbox. A frame
+    still waiting when the next one arrives is dropped, the servos only ever need the newest one.
+    Frames are copied into a pool of three preallocated buffers and passed through deques,
+    whose append and popleft are atomic, so the handoff takes no lock. Waking the thread
+    does: put() sets a threading.Event, which briefly holds the event's lock.
+
+    An OSError from write_function is counted and printed, and the thread keeps writing the
+    following frames. The next put() raises it, so the control loop does not keep running
+    with servos that stopped responding.
+    """
+
+    def __init__(self, write_function, wait_timeout=0.1):
+        """
+        Parameters
+        ----------
+        write_function : callable
+            Called with each (3,4) joint angle frame from the output thread.
+        wait_timeout : float
+            How often the thread checks for stop() while no frames arrive [s].
+        """
+        super().__init__(name="ServoOutputThread", daemon=True)
+        self.write_function = write_function
+        self.wait_timeout = wait_timeout
+
+        # One buffer being filled by put, one in the mailbox and one being written
+        self.free_frames = deque(ServoFrame() for _ in range(3))
+        self.mailbox = deque(maxlen=1)
+        self.frame_ready = threading.Event()
+        self.running = True
+
+        # Metrics
+        self.put_count = 0
+        self.written_frames = 0
+        self.dropped_frames = 0
+        self.last_write_time = 0.0
+        self.max_write_time = 0.0
+        self.total_write_time = 0.0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.write_errors = 0
+        # Error raised by write_function and not yet raised from put()
+        self.write_error = None
+
+    def put(self, joint_angles):
+        """Makes joint_angles the next frame to write. Never blocks.
+
+        Raises the last OSError from write_function since the previous put(), and RuntimeError
+        if the thread is no longer running.
+        """
+        if self.write_error is not None:
+            (write_error, self.write_error) = (self.write_error, None)
+            raise write_error
+        if not self.is_alive():
+            raise RuntimeError("ServoOutputThread is not running")
+        frame = self.free_frames.popleft()
+        np.copyto(frame.joint_angles, joint_angles)
+        frame.put_time = time.monotonic()
+        try:
+            stale_frame = self.mailbox.popleft()
+        except IndexError:
+            pass
+        else:
+            self.dropped_frames += 1
+            self.free_frames.append(stale_frame)
+        self.mailbox.append(frame)
+        self.put_count += 1
+        self.frame_ready.set()
+
+    def run(self):
+        while self.running:
+            # Clear before checking the mailbox so a frame put in between still wakes us up
+            self.frame_ready.clear()
+            try:
+                frame = self.mailbox.popleft()
+            except IndexError:
+                self.frame_ready.wait(self.wait_timeout)
+                continue
+
+            start_time = time.monotonic()
+            try:
+                self.write_function(frame.joint_angles)
+            except OSError as error:
+                self.write_errors += 1
+                self.write_error = error
+                print("Servo write failed (" + str(self.write_errors) + " errors so far): " + str(error))
+                continue
+            finally:
+                end_time = time.monotonic()
+                latency = end_time - frame.put_time
+                self.free_frames.append(frame)
+
+            self.written_frames += 1
+            self.last_write_time = end_time - start_time
+            self.max_write_time = max(self.max_write_time, self.last_write_time)
+            self.total_write_time += self.last_write_time
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def stop(self):
+        """Stops the thread after the frame being written, if any"""
+        self.running = False
+        self.frame_ready.set()
+        self.join()
+
+    @property
+    def mean_write_time(self):
+        return self.total_write_time / self.written_frames if self.written_frames else 0.0
+
+
+class PWMWriter:
+    """Writes duty cycles to the pwm sysfs nodes of all twelve servos.
+
+    The duty_cycle nodes are opened once, unbuffered, and every update is a single
+    pwrite at offset 0, instead of opening the node for each write.
+    """
+
+    def __init__(self, pwm_params, root=None):
+        """
+        Parameters
+        ----------
+        pwm_params : PWMParams
+            PWMParams object
+        root : str, optional
+            Directory holding the pwmN/duty_cycle nodes, defaults to pwm_params.sysfs_root.
+            Point it to a fake tree to run without hardware.
+        """
+        self.pwm_params = pwm_params
+        self.root = pwm_params.sysfs_root if root is None else root
+        self.fds = [[None] * 4 for _ in range(3)]
+        try:
+            for axis_index in range(3):
+                for leg_index in range(4):
+                    file_node = os.path.join(
+                        self.root, "pwm" + str(pwm_params.pins[axis_index, leg_index]), "duty_cycle"
+                    )
+                    self.fds[axis_index][leg_index] = os.open(file_node, os.O_WRONLY)
+        except OSError:
+            self.close()
+            raise
+
+    def write(self, duty_cycle, axis_index, leg_index):
+        os.pwrite(self.fds[axis_index][leg_index], b"%d\n" % duty_cycle, 0)
+
+    def write_all(self, duty_cycles, mask=None):
+        """Writes a (3,4) matrix of integer duty cycles, one per servo
+
+        Parameters
+        ----------
+        duty_cycles : numpy array (3,4)
+            Integer duty cycles
+        mask : numpy array (3,4) of bools, optional
+            Only the servos where the mask is True are written. All servos are written if None.
+        """
+        if mask is None:
+            for fds_row, duty_cycles_row in zip(self.fds, duty_cycles.tolist()):
+                for fd, duty_cycle in zip(fds_row, duty_cycles_row):
+                    os.pwrite(fd, b"%d\n" % duty_cycle, 0)
+        else:
+            for (axis_index, leg_index) in zip(*np.nonzero(mask)):
+                self.write(duty_cycles[axis_index, leg_index], axis_index, leg_index)
+
+    def close(self):
+        for row in self.fds:
+            for leg_index, fd in enumerate(row):
+                if fd is not None:
+                    os.close(fd)
+                    row[leg_index] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def make_pwm_writer(pwm_params, pwm_root=None):
+    """Opens the servo writer selected by pwm_params.backend"""
+    if pwm_params.backend == "sysfs":
+        return PWMWriter(pwm_params, pwm_root)
+    if pwm_params.backend == "i2c":
+        return PCA9685Writer(pwm_params)
+    raise ValueError("Unknown PWM backend " + str(pwm_params.backend) + ", use 'sysfs' or 'i2c'")
 
 
 def pwm_to_duty_cycle(pulsewidth_micros, pwm_params):
@@ -77,31 +351,60 @@ def angle_to_duty_cycle(angle, pwm_params, servo_params, axis_index, leg_index):
     return int(duty_cycle_f)
 
 
+def angles_to_duty_cycles(joint_angles, servo_params, out=None, work=None, nan_mask=None):
+    """Converts the desired angles of all twelve servos into their duty cycles at once
+
+    Same result as calling angle_to_duty_cycle for every joint.
+
+    Parameters
+    ----------
+    joint_angles : numpy array (3,4)
+        Desired servo angles, NaN angles give a duty cycle of 0
+    servo_params : ServoParams
+        ServoParams object
+    out : numpy array (3,4) of ints, optional
+        Preallocated array the duty cycles are written into. A new array is allocated if None.
+    work : numpy array (3,4) of floats, optional
+        Preallocated array for the unrounded duty cycles. A new array is allocated if None.
+    nan_mask : numpy array (3,4) of bools, optional
+        Preallocated array for the NaN angles. A new array is allocated if None.
+
+    Returns
+    -------
+    numpy array (3,4)
+        Integer duty cycles
+    """
+    if out is None:
+        out = np.empty((3, 4), dtype=np.int64)
+    if work is None:
+        work = np.empty((3, 4))
+    if nan_mask is None:
+        nan_mask = np.empty((3, 4), dtype=bool)
+    np.subtract(joint_angles, servo_params.neutral_angles, out=work)
+    np.multiply(work, servo_params.servo_multipliers, out=work)
+    np.multiply(work, servo_params.micros_per_rad, out=work)
+    np.add(work, float(servo_params.neutral_position_pwm), out=work)
+    np.multiply(work, 1e3, out=work)
+    np.isnan(work, out=nan_mask)
+    np.putmask(work, nan_mask, 0.0)
+    np.copyto(out, work, casting="unsafe")
+    return out
+
+
 def initialize_pwm(pi, pwm_params):
     pi.set_pwm_freq(pwm_params.freq)
 
 
-def send_servo_commands(pwm_params, servo_params, joint_angles):
-    for leg_index in range(4):
-        for axis_index in range(3):
-            duty_cycle = angle_to_duty_cycle(
-                joint_angles[axis_index, leg_index],
-                pwm_params,
-                servo_params,
-                axis_index,
-                leg_index,
-            )
-            # write duty_cycle to pwm linux kernel node
-            file_node = "/sys/class/pwm/pwmchip0/pwm" + str(pwm_params.pins[axis_index, leg_index]) + "/duty_cycle"
-            f = open(file_node, "w")
-            f.write(str(duty_cycle))
-
-
-def send_servo_command(pwm_params, servo_params, joint_angle, axis, leg):
-    duty_cycle = angle_to_duty_cycle(joint_angle, pwm_params, servo_params, axis, leg)
-    file_node = "/sys/class/pwm/pwmchip0/pwm" + str(pwm_params.pins[axis, leg]) + "/duty_cycle"
-    f = open(file_node, "w")
-    f.write(str(duty_cycle))
+def send_servo_commands(pwm_writer, servo_params, joint_angles):
+    duty_cycles = angles_to_duty_cycles(joint_angles, servo_params)
+    # write duty_cycle to pwm linux kernel node
+    pwm_writer.write_all(duty_cycles)
+
+
+def send_servo_command(pwm_writer, servo_params, joint_angle, axis, leg):
+    duty_cycle = angle_to_duty_cycle(joint_angle, pwm_writer.pwm_params, servo_params, axis, leg)
+    pwm_writer.write(duty_cycle, axis, leg)
+    return duty_cycle
 
 
 def deactivate_servos(pi, pwm_params):
@@ -20,16 +20,17 @@ def leg_explicit_inverse_kinematics(r_body_foot, leg_index, config):
         Array of corresponding joint angles.
     """
     (x, y, z) = r_body_foot
+    compiled = config.compiled
 
     # Distance from the leg origin to the foot, projected into the y-z plane
     R_body_foot_yz = (y ** 2 + z ** 2) ** 0.5
 
     # Distance from the leg's forward/back point of rotation to the foot
-    R_hip_foot_yz = (R_body_foot_yz ** 2 - config.ABDUCTION_OFFSET ** 2) ** 0.5
+    R_hip_foot_yz = (R_body_foot_yz ** 2 - compiled.ABDUCTION_OFFSET_SQ) ** 0.5
 
     # Interior angle of the right triangle formed in the y-z plane by the leg that is coincident to the ab/adduction axis
     # For feet 2 (front left) and 4 (back left), the abduction offset is positive, for the right feet, the abduction offset is negative.
-    arccos_argument = config.ABDUCTION_OFFSETS[leg_index] / R_body_foot_yz
+    arccos_argument = compiled.ABDUCTION_OFFSETS[leg_index] / R_body_foot_yz
     arccos_argument = np.clip(arccos_argument, -0.99, 0.99)
     phi = np.arccos(arccos_argument)
 
@@ -46,8 +47,8 @@ def leg_explicit_inverse_kinematics(r_body_foot, leg_index, config):
     R_hip_foot = (R_hip_foot_yz ** 2 + x ** 2) ** 0.5
 
     # Angle between the line going from hip to foot and the link L1
-    arccos_argument = (config.LEG_L1 ** 2 + R_hip_foot ** 2 - config.LEG_L2 ** 2) / (
-        2 * config.LEG_L1 * R_hip_foot
+    arccos_argument = (compiled.LEG_L1_SQ + R_hip_foot ** 2 - compiled.LEG_L2_SQ) / (
+        compiled.TWO_LEG_L1 * R_hip_foot
     )
     arccos_argument = np.clip(arccos_argument, -0.99, 0.99)
     trident = np.arccos(arccos_argument)
@@ -56,8 +57,8 @@ def leg_explicit_inverse_kinematics(r_body_foot, leg_index, config):
     hip_angle = theta + trident
 
     # Angle between the leg links L1 and L2
-    arccos_argument = (config.LEG_L1 ** 2 + config.LEG_L2 ** 2 - R_hip_foot ** 2) / (
-        2 * config.LEG_L1 * config.LEG_L2
+    arccos_argument = (compiled.LEG_L1_SQ_PLUS_L2_SQ - R_hip_foot ** 2) / (
+        compiled.TWO_LEG_L1_L2
     )
     arccos_argument = np.clip(arccos_argument, -0.99, 0.99)
     beta = np.arccos(arccos_argument)
@@ -68,8 +69,120 @@ def leg_explicit_inverse_kinematics(r_body_foot, leg_index, config):
     return np.array([abduction_angle, hip_angle, knee_angle])
 
 
-def four_legs_inverse_kinematics(r_body_foot, config):
+class InverseKinematicsScratch:
+    """Preallocated intermediate arrays of _stacked_inverse_kinematics for one shape of foot positions.
+
+    Reusing one scratch lets the solver run without allocating any arrays.
+    """
+
+    def __init__(self, shape=(3, 4)):
+        """
+        Parameters
+        ----------
+        shape : tuple of int
+            Shape of the foot position arrays solved, the last two axes are (3,4).
+        """
+        self.shape = tuple(shape)
+        leg_shape = self.shape[:-2] + self.shape[-1:]
+        self.r_leg_foot = np.empty(self.shape)
+        self.x = self.r_leg_foot[..., 0, :]
+        self.y = self.r_leg_foot[..., 1, :]
+        self.z = self.r_leg_foot[..., 2, :]
+        self.joint_angles = np.empty(self.shape)
+        self.abduction_angle = self.joint_angles[..., 0, :]
+        self.hip_angle = self.joint_angles[..., 1, :]
+        self.knee_angle = self.joint_angles[..., 2, :]
+        self.R_body_foot_yz = np.empty(leg_shape)
+        self.R_hip_foot_yz = np.empty(leg_shape)
+        self.R_hip_foot = np.empty(leg_shape)
+        self.R_hip_foot_sq = np.empty(leg_shape)
+        self.theta = np.empty(leg_shape)
+        self.angle = np.empty(leg_shape)
+        self.temp = np.empty(leg_shape)
+
+
+def _clip_arccos(argument):
+    """arccos of the argument clipped to [-0.99, 0.99], in place"""
+    np.minimum(argument, 0.99, out=argument)
+    np.maximum(argument, -0.99, out=argument)
+    return np.arccos(argument, out=argument)
+
+
+def _stacked_inverse_kinematics(r_body_foot, config, out, scratch):
+    """Solve the inverse kinematics for an array of foot positions whose last two axes are (3,4).
+
+    The math is the same as leg_explicit_inverse_kinematics, evaluated element-wise over every
+    leg (and every leading index) at once. Intermediate results go into scratch, the joint
+    angles into out, which is returned.
+    """
+    compiled = config.compiled
+    s = scratch
+    np.subtract(r_body_foot, compiled.LEG_ORIGINS, out=s.r_leg_foot)
+    (x, y, z) = (s.x, s.y, s.z)
+    temp = s.temp
+    angle = s.angle
+
+    # Distance from the leg origin to the foot, projected into the y-z plane
+    np.square(y, out=angle)
+    np.square(z, out=temp)
+    np.add(angle, temp, out=temp)
+    np.sqrt(temp, out=s.R_body_foot_yz)
+
+    # Distance from the leg's forward/back point of rotation to the foot
+    np.square(s.R_body_foot_yz, out=temp)
+    np.subtract(temp, compiled.ABDUCTION_OFFSET_SQ, out=temp)
+    np.sqrt(temp, out=s.R_hip_foot_yz)
+
+    # Interior angle of the right triangle formed in the y-z plane by the leg that is coincident to the ab/adduction axis
+    np.divide(compiled.ABDUCTION_OFFSETS, s.R_body_foot_yz, out=angle)
+    phi = _clip_arccos(angle)
+
+    # Ab/adduction angle, relative to the positive y-axis
+    np.arctan2(z, y, out=temp)
+    np.add(phi, temp, out=s.abduction_angle)
+
+    # theta: Angle between the tilted negative z-axis and the hip-to-foot vector
+    np.negative(x, out=temp)
+    np.arctan2(temp, s.R_hip_foot_yz, out=s.theta)
+
+    # Distance between the hip and foot
+    np.square(s.R_hip_foot_yz, out=angle)
+    np.square(x, out=temp)
+    np.add(angle, temp, out=temp)
+    np.sqrt(temp, out=s.R_hip_foot)
+    np.square(s.R_hip_foot, out=s.R_hip_foot_sq)
+
+    # Angle between the line going from hip to foot and the link L1
+    np.add(s.R_hip_foot_sq, compiled.LEG_L1_SQ, out=angle)
+    np.subtract(angle, compiled.LEG_L2_SQ, out=angle)
+    np.multiply(s.R_hip_foot, compiled.TWO_LEG_L1, out=temp)
+    np.divide(angle, temp, out=angle)
+    trident = _clip_arccos(angle)
+
+    # Angle of the first link relative to the tilted negative z axis
+    np.add(s.theta, trident, out=s.hip_angle)
+
+    # Angle between the leg links L1 and L2
+    np.subtract(compiled.LEG_L1_SQ_PLUS_L2_SQ, s.R_hip_foot_sq, out=angle)
+    np.divide(angle, compiled.TWO_LEG_L1_L2, out=angle)
+    beta = _clip_arccos(angle)
+
+    # Angle of the second link relative to the tilted negative z axis
+    np.subtract(np.pi, beta, out=temp)
+    np.subtract(s.hip_angle, temp, out=s.knee_angle)
+
+    np.copyto(out, s.joint_angles)
+    return out
+
+
+# Scratch of four_legs_inverse_kinematics, the control loop solves one (3,4) matrix per tick
+_FOUR_LEGS_SCRATCH = InverseKinematicsScratch((3, 4))
+
+
+def four_legs_inverse_kinematics(r_body_foot, config, out=None, scratch=None):
     """Find the joint angles for all twelve DOF correspoinding to the given matrix of body-relative foot positions.
+
+    All four legs are solved at once with array operations.
     
     Parameters
     ----------
@@ -77,16 +190,49 @@ def four_legs_inverse_kinematics(r_body_foot, config):
         Matrix of the body-frame foot positions. Each column corresponds to a separate foot.
     config : Config object
         Object of robot configuration parameters.
+    out : numpy array (3,4), optional
+        Preallocated array the joint angles are written into. A new array is allocated if None.
+    scratch : InverseKinematicsScratch, optional
+        Intermediate arrays of the solver. A module-wide one is used if None, so calls from
+        several threads need their own.
     
     Returns
     -------
     numpy array (3,4)
         Matrix of corresponding joint angles.
     """
-    alpha = np.zeros((3, 4))
-    for i in range(4):
-        body_offset = config.LEG_ORIGINS[:, i]
-        alpha[:, i] = leg_explicit_inverse_kinematics(
-            r_body_foot[:, i] - body_offset, i, config
+    if out is None:
+        out = np.empty((3, 4))
+    if scratch is None:
+        scratch = _FOUR_LEGS_SCRATCH
+    return _stacked_inverse_kinematics(r_body_foot, config, out, scratch)
+
+
+def batch_inverse_kinematics(r_body_foot, config, out=None):
+    """Find the joint angles for a whole trajectory of body-relative foot position matrices in one call.
+
+    Useful for validating or pre-computing joint trajectories offline, e.g. the leg locations
+    produced by a MovementScheme.
+
+    Parameters
+    ----------
+    r_body_foot : numpy array (N,3,4)
+        Stack of N body-frame foot position matrices. Each column of a matrix corresponds to a separate foot.
+    config : Config object
+        Object of robot configuration parameters.
+    out : numpy array (N,3,4), optional
+        Preallocated array the joint angles are written into. A new array is allocated if None.
+
+    Returns
+    -------
+    numpy array (N,3,4)
+        Stack of corresponding joint angle matrices.
+    """
+    r_body_foot = np.asarray(r_body_foot, dtype=float)
+    if r_body_foot.ndim != 3 or r_body_foot.shape[1:] != (3, 4):
+        raise ValueError(
+            "Expected foot positions of shape (N, 3, 4), got " + str(r_body_foot.shape)
         )
-    return alpha
+    if out is None:
+        out = np.empty(r_body_foot.shape)
+    return _stacked_inverse_kinematics(r_body_foot, config, out, InverseKinematicsScratch(r_body_foot.shape))
@@ -0,0 +1,271 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from pupper.Config import Configuration
+from pupper.Kinematics import batch_inverse_kinematics, four_legs_inverse_kinematics
+
+# Number of random foot positions compared with the analytic solver when a table is loaded
+LOAD_CHECK_POINTS = 16
+
+# Rows of the table: the 3 joint angles, then their derivatives by the x, y and z grid
+# coordinates, 3 angles for each axis
+TABLE_ROWS = 12
+
+
+class KinematicsTable:
+    """Inverse kinematics answered from a precomputed grid of joint angles.
+
+    Each leg has its own regular grid of foot positions around its default stance location,
+    covering config.ik_table_box at config.ik_table_resolution. Every grid point stores its
+    joint angles and their Jacobian, and a query expands them to first order around the grid
+    point nearest to each foot. That is one gather and a few same-shape ufuncs on preallocated
+    buffers. Trilinear interpolation needs broadcasting ufuncs and a reduction for its corner
+    weights, which allocate and make it slower than the analytic solver. Queries with a foot
+    outside the grid fall back to the analytic solver.
+
+    The table is stored as a plain .npy file so several processes can share one memory-mapped copy.
+    The hash of the geometry it was built for is kept next to it in a .json file, since .npy
+    headers cannot hold extra keys. Queries recheck the hash whenever config.compiled is rebuilt
+    and fall back to the analytic solver while the geometry differs.
+    """
+
+    def __init__(self, config, table, geometry_hash=None):
+        """
+        Parameters
+        ----------
+        geometry_hash : str, optional
+            config.compiled.geometry_hash of the configuration the table was built for.
+            None means it was built for config.
+        """
+        self.config = config
+        self.lower, self.spacing, shape = grid_layout(config)
+        if table.shape != shape:
+            raise ValueError(
+                "IK table has shape " + str(table.shape) + " but the configuration needs " + str(shape)
+            )
+        self.table = table
+        self.geometry_hash = config.compiled.geometry_hash if geometry_hash is None else geometry_hash
+        self.compiled = None
+        self.stale = False
+        self.check_geometry(config)
+
+        self.counts = np.array(shape[2:5])
+        self.inverse_spacing = 1.0 / self.spacing
+        # A foot is inside the grid if its nearest grid point is at most this far from the middle one
+        self.half_extent = np.repeat((self.counts[:, np.newaxis] - 1) / 2.0, 4, axis=1)
+        # Queries gather the entry of every leg's nearest grid point with one lookup into the
+        # flattened table, the grid points of leg i follow those of leg i - 1
+        self.flat_table = np.asarray(table).reshape(TABLE_ROWS, -1)
+        self.strides = np.array([shape[3] * shape[4], shape[4], 1], dtype=float)
+        self.leg_offsets = np.arange(4) * float(np.prod(self.counts))
+
+        # Scratch buffers, and views of them made once, so a query does not allocate
+        self.grid_position = np.zeros((3, 4))
+        self.nearest = np.zeros((3, 4))
+        self.distance = np.zeros((3, 4))
+        self.outside = np.zeros((3, 4), dtype=bool)
+        self.offset = np.zeros((3, 4))
+        self.point_index_float = np.zeros(4)
+        self.point_index = np.zeros(4, dtype=np.intp)
+        self.entries = np.zeros((TABLE_ROWS, 4), dtype=table.dtype)
+        self.entry_angles = self.entries[:3]
+        # jacobian[b, a] is the derivative of joint angle a by grid coordinate b
+        self.entry_jacobian = self.entries[3:].reshape(3, 3, 4)
+        self.offset_rows = np.broadcast_to(self.offset[:, np.newaxis, :], (3, 3, 4))
+        self.offsets = np.zeros((3, 3, 4), dtype=table.dtype)
+        self.terms = np.zeros((3, 3, 4), dtype=table.dtype)
+        (self.x_term, self.y_term, self.z_term) = self.terms
+        self.joint_angles = np.zeros((3, 4), dtype=table.dtype)
+
+    @classmethod
+    def build(cls, config):
+        """Compute the table with the analytic solver and check its interpolation error.
+
+        Raises ValueError if the interpolation error at the cell centers exceeds config.ik_table_max_error.
+        """
+        lower, spacing, shape = grid_layout(config)
+        axes = [np.arange(n) * spacing for n in shape[2:5]]
+        offsets = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+        foot_positions = lower[np.newaxis, :, :] + offsets[:, :, np.newaxis]
+        joint_angles = batch_inverse_kinematics(foot_positions, config)
+        # (N, 3, 4) -> (3, 4, nx, ny, nz)
+        angles = joint_angles.transpose(1, 2, 0).reshape((3,) + shape[1:])
+        # Derivatives by the grid coordinates, second order accurate up to the faces of the grid
+        jacobian = np.gradient(angles, axis=(2, 3, 4), edge_order=2)
+        table = np.concatenate([angles] + list(jacobian)).astype(np.float32)
+        ik_table = cls(config, table)
+
+        # Cell centers are the points furthest from the grid samples
+        not_upper_face = np.all(offsets < offsets[-1] - spacing / 2, axis=1)
+        centers = foot_positions[not_upper_face] + spacing / 2
+        error = ik_table.max_error(centers)
+        if error > config.ik_table_max_error:
+            raise ValueError(
+                "IK table interpolation error "
+                + str(error)
+                + " rad exceeds ik_table_max_error, use a smaller ik_table_resolution"
+            )
+        return ik_table
+
+    @classmethod
+    def load(cls, filename, config, mmap=True):
+        """Load a table saved with save(). By default the file is memory mapped read-only.
+
+        Raises ValueError if the table was built for a different geometry, or if its joint angles
+        at LOAD_CHECK_POINTS random foot positions differ from the analytic solver by more than
+        config.ik_table_max_error.
+        """
+        table = np.load(filename, mmap_mode="r" if mmap else None)
+        try:
+            with open(metadata_filename(filename)) as metadata_file:
+                geometry_hash = json.load(metadata_file)["geometry_hash"]
+        except (OSError, ValueError, KeyError):
+            raise ValueError("IK table " + str(filename) + " has no geometry metadata, rebuild it")
+        if geometry_hash != config.compiled.geometry_hash:
+            raise ValueError("IK table " + str(filename) + " was built for a different geometry, rebuild it")
+
+        ik_table = cls(config, table, geometry_hash)
+        # Catch corrupted or truncated tables
+        if ik_table.max_error(ik_table.random_foot_positions(LOAD_CHECK_POINTS)) > config.ik_table_max_error:
+            raise ValueError("IK table " + str(filename) + " does not match the configuration, rebuild it")
+        return ik_table
+
+    def save(self, filename):
+        np.save(filename, self.table)
+        with open(metadata_filename(filename), "w") as metadata_file:
+            json.dump({"geometry_hash": self.geometry_hash}, metadata_file)
+
+    def check_geometry(self, config):
+        """Compare the table's geometry hash with config.compiled, which changes after any parameter change"""
+        self.compiled = config.compiled
+        stale = self.compiled.geometry_hash != self.geometry_hash
+        if stale and not self.stale:
+            print("IK table does not match the changed geometry, using analytic inverse kinematics")
+        self.stale = stale
+
+    def random_foot_positions(self, count, rng=None):
+        """Uniformly distributed foot positions inside every leg's grid.
+
+        Returns
+        -------
+        numpy array (count,3,4)
+            Stack of body-frame foot position matrices.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        extent = self.spacing * (self.counts - 1)[:, np.newaxis]
+        return self.lower + rng.uniform(size=(count, 3, 4)) * extent
+
+    def max_error(self, foot_positions):
+        """Largest joint angle difference between the table and the analytic solver.
+
+        Parameters
+        ----------
+        foot_positions : numpy array (N,3,4)
+            Stack of body-frame foot position matrices inside the grid.
+
+        Returns
+        -------
+        float
+            Maximum absolute error in radians.
+        """
+        error = 0.0
+        joint_angles = np.empty((3, 4))
+        exact = batch_inverse_kinematics(foot_positions, self.config)
+        for r_body_foot, exact_angles in zip(foot_positions, exact):
+            self.inverse_kinematics(r_body_foot, self.config, out=joint_angles)
+            error = max(error, np.abs(joint_angles - exact_angles).max())
+        return error
+
+    def inverse_kinematics(self, r_body_foot, config, out=None):
+        """Drop-in replacement for four_legs_inverse_kinematics.
+
+        Parameters
+        ----------
+        r_body_foot : numpy array (3,4)
+            Matrix of the body-frame foot positions. Each column corresponds to a separate foot.
+        config : Config object
+            Object of robot configuration parameters.
+        out : numpy array (3,4), optional
+            Preallocated array the joint angles are written into. A new array is allocated if None.
+
+        Returns
+        -------
+        numpy array (3,4)
+            Matrix of corresponding joint angles.
+        """
+        if config.compiled is not self.compiled:
+            self.check_geometry(config)
+        if self.stale:
+            return four_legs_inverse_kinematics(r_body_foot, config, out=out)
+        if out is None:
+            out = np.empty((3, 4))
+
+        # Grid coordinates of the feet and of their nearest grid points
+        np.subtract(r_body_foot, self.lower, out=self.grid_position)
+        np.multiply(self.grid_position, self.inverse_spacing, out=self.grid_position)
+        np.rint(self.grid_position, out=self.nearest)
+        np.subtract(self.nearest, self.half_extent, out=self.distance)
+        np.abs(self.distance, out=self.distance)
+        np.greater(self.distance, self.half_extent, out=self.outside)
+        if np.count_nonzero(self.outside):
+            return four_legs_inverse_kinematics(r_body_foot, config, out=out)
+        np.subtract(self.grid_position, self.nearest, out=self.offset)
+
+        np.dot(self.strides, self.nearest, out=self.point_index_float)
+        np.add(self.point_index_float, self.leg_offsets, out=self.point_index_float)
+        np.copyto(self.point_index, self.point_index_float, casting="unsafe")
+        # The indices are in range, mode="clip" skips the bounds check, which allocates
+        self.flat_table.take(self.point_index, axis=1, out=self.entries, mode="clip")
+
+        # Joint angles of the grid point plus the Jacobian times the offset from it
+        np.copyto(self.offsets, self.offset_rows, casting="same_kind")
+        np.multiply(self.entry_jacobian, self.offsets, out=self.terms)
+        np.add(self.x_term, self.y_term, out=self.joint_angles)
+        np.add(self.joint_angles, self.z_term, out=self.joint_angles)
+        np.add(self.joint_angles, self.entry_angles, out=self.joint_angles)
+        np.copyto(out, self.joint_angles)
+        return out
+
+
+def grid_layout(config):
+    """Find the grid of the IK table described by the configuration.
+
+    Returns
+    -------
+    (numpy array (3,4), float, tuple)
+        (Body-frame position of every leg's first grid point, grid spacing, table shape)
+    """
+    box = np.asarray(config.ik_table_box, dtype=float)
+    spacing = config.ik_table_resolution
+    lower = config.compiled.default_stance + box[:, 0][:, np.newaxis]
+    counts = tuple(int(round((high - low) / spacing)) + 1 for (low, high) in box)
+    return lower, spacing, (TABLE_ROWS, 4) + counts
+
+
+def metadata_filename(filename):
+    """Name of the .json file holding the geometry hash of the table saved as filename"""
+    return os.path.splitext(str(filename))[0] + ".json"
+
+
+def load_inverse_kinematics(config):
+    """Return the table-based solver if config.use_ik_table is set and the table loads, else the analytic one"""
+    if not config.use_ik_table:
+        return four_legs_inverse_kinematics
+    try:
+        ik_table = KinematicsTable.load(config.ik_table_file, config)
+    except (OSError, ValueError) as error:
+        print("Could not load IK table, using analytic inverse kinematics:", error)
+        return four_legs_inverse_kinematics
+    return ik_table.inverse_kinematics
+
+
+if __name__ == "__main__":
+    config = Configuration()
+    filename = sys.argv[1] if len(sys.argv) > 1 else config.ik_table_file
+    ik_table = KinematicsTable.build(config)
+    ik_table.save(filename)
+    print("Saved IK table", ik_table.table.shape, "to", filename)
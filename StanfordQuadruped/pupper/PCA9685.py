@@ -0,0 +1,186 @@
+import fcntl
+import os
+
+import numpy as np
+
+MODE1 = 0x00
+MODE1_AUTO_INCREMENT = 0x20
+LED0_ON_L = 0x06
+LED_FULL = 0x10
+CHANNEL_COUNT = 16
+COUNTER_RANGE = 4096
+
+# ioctl from linux/i2c-dev.h. The force variant is needed because the pwm-pca9685
+# kernel driver keeps the chip bound for the period setup done in rc.local.
+I2C_SLAVE_FORCE = 0x0706
+
+
+class I2CDevice:
+    """A device on a /dev/i2c-N bus, written and read with plain I2C transactions"""
+
+    def __init__(self, bus, address):
+        """
+        Parameters
+        ----------
+        bus : int
+            Number of the /dev/i2c-N bus.
+        address : int
+            7 bit address of the device.
+        """
+        self.fd = None
+        self.fd = os.open("/dev/i2c-" + str(bus), os.O_RDWR)
+        try:
+            fcntl.ioctl(self.fd, I2C_SLAVE_FORCE, address)
+        except OSError:
+            self.close()
+            raise
+
+    def write(self, data):
+        os.write(self.fd, data)
+
+    def read(self, length):
+        return os.read(self.fd, length)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __del__(self):
+        self.close()
+
+
+class FakePCA9685Device:
+    """Stands in for an I2CDevice talking to a PCA9685, to run the I2C backend without hardware.
+
+    Keeps the 256 register file and follows the chip's auto-increment rule, so the
+    written duty cycles can be read back with duty_counts().
+    """
+
+    def __init__(self):
+        self.registers = bytearray(256)
+        self.pointer = 0
+        self.transactions = 0
+
+    def write(self, data):
+        self.transactions += 1
+        self.pointer = data[0]
+        auto_increment = self.registers[MODE1] & MODE1_AUTO_INCREMENT
+        for value in data[1:]:
+            self.registers[self.pointer] = value
+            if auto_increment:
+                self.pointer = (self.pointer + 1) % 256
+
+    def read(self, length):
+        data = bytes(self.registers[self.pointer : self.pointer + length])
+        if self.registers[MODE1] & MODE1_AUTO_INCREMENT:
+            self.pointer = (self.pointer + length) % 256
+        return data
+
+    def duty_counts(self):
+        """Returns the (16,) on-time of each channel in counts out of COUNTER_RANGE"""
+        leds = np.frombuffer(bytes(self.registers[LED0_ON_L : LED0_ON_L + 4 * CHANNEL_COUNT]), dtype=np.uint8)
+        leds = leds.reshape(CHANNEL_COUNT, 4).astype(int)
+        counts = leds[:, 2] + ((leds[:, 3] & 0x0F) << 8)
+        counts[leds[:, 1] & LED_FULL != 0] = COUNTER_RANGE
+        counts[leds[:, 3] & LED_FULL != 0] = 0
+        return counts
+
+    def close(self):
+        pass
+
+
+class PCA9685Writer:
+    """Writes duty cycles straight to the PCA9685 over I2C, bypassing the pwm sysfs nodes.
+
+    Same interface as HardwareInterface.PWMWriter. All channels of an update are sent in
+    one auto-increment block write of their LEDn_ON_L..LEDn_OFF_H registers, instead of
+    one sysfs write and several register writes per channel.
+    """
+
+    def __init__(self, pwm_params, device=None):
+        """
+        Parameters
+        ----------
+        pwm_params : PWMParams
+            PWMParams object
+        device : I2CDevice or FakePCA9685Device, optional
+            Device the registers are written to, defaults to pwm_params.i2c_bus and pwm_params.i2c_address.
+        """
+        self.pwm_params = pwm_params
+        self.device = I2CDevice(pwm_params.i2c_bus, pwm_params.i2c_address) if device is None else device
+        # Duty cycles are in ns of the pwm period, like the sysfs duty_cycle nodes
+        self.period = int(round(1e9 / pwm_params.freq))
+        self.channels = np.asarray(pwm_params.pins)
+
+        # Register image of every channel, the written span is taken from it
+        self.leds = np.zeros((CHANNEL_COUNT, 4), dtype=np.uint8)
+        self.leds[:, 3] = LED_FULL
+        self.counts = np.zeros((3, 4), dtype=np.int64)
+        self.block = bytearray(1 + 4 * CHANNEL_COUNT)
+        self.first_channel = int(self.channels.min())
+        self.last_channel = int(self.channels.max())
+
+        self.device.write(bytes([MODE1]))
+        mode1 = self.device.read(1)[0]
+        if not mode1 & MODE1_AUTO_INCREMENT:
+            self.device.write(bytes([MODE1, mode1 | MODE1_AUTO_INCREMENT]))
+
+    def write(self, duty_cycle, axis_index, leg_index):
+        channel = int(self.channels[axis_index, leg_index])
+        self.set_leds(channel, duty_to_count(duty_cycle, self.period))
+        self.write_block(channel, channel)
+
+    def write_all(self, duty_cycles, mask=None):
+        """Writes a (3,4) matrix of integer duty cycles, one per servo, in a single block write
+
+        Parameters
+        ----------
+        duty_cycles : numpy array (3,4)
+            Integer duty cycles
+        mask : numpy array (3,4) of bools, optional
+            Only the servos where the mask is True are updated. All servos are updated if None.
+        """
+        np.multiply(duty_cycles, COUNTER_RANGE, out=self.counts)
+        self.counts += self.period - 1
+        self.counts //= self.period
+        if mask is None:
+            self.set_leds(self.channels, self.counts)
+            self.write_block(self.first_channel, self.last_channel)
+        else:
+            channels = self.channels[mask]
+            if channels.size == 0:
+                return
+            self.set_leds(channels, self.counts[mask])
+            self.write_block(int(channels.min()), int(channels.max()))
+
+    def set_leds(self, channels, counts):
+        """Fills the register image the way the pwm-pca9685 driver sets a duty cycle"""
+        counts = np.asarray(counts)
+        full_on = counts >= COUNTER_RANGE
+        full_off = counts <= 0
+        partial = np.clip(counts, 0, COUNTER_RANGE - 1)
+        self.leds[channels, 0] = 0
+        self.leds[channels, 1] = np.where(full_on, LED_FULL, 0)
+        self.leds[channels, 2] = np.where(full_on | full_off, 0, partial & 0xFF)
+        self.leds[channels, 3] = np.where(full_off, LED_FULL, np.where(full_on, 0, partial >> 8))
+
+    def write_block(self, first_channel, last_channel):
+        length = 4 * (last_channel - first_channel + 1)
+        self.block[0] = LED0_ON_L + 4 * first_channel
+        self.block[1 : 1 + length] = self.leds[first_channel : last_channel + 1].tobytes()
+        self.device.write(bytes(self.block[: 1 + length]))
+
+    def close(self):
+        self.device.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def duty_to_count(duty_cycle, period):
+    """Converts a duty cycle in ns into PCA9685 counts, rounding up like the pwm-pca9685 driver"""
+    return (int(duty_cycle) * COUNTER_RANGE + period - 1) // period
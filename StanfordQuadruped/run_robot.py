@@ -10,29 +10,35 @@ import multiprocessing
 
 sys.path.append("/home/ubuntu/Robotics/QuadrupedRobot")
 sys.path.extend([os.path.join(root, name) for root, dirs, _ in os.walk("/home/ubuntu/Robotics/QuadrupedRobot") for name in dirs])
-from Mangdang.LCD.ST7789 import ST7789
-from Mangdang.LCD.gif import AnimatedGif
 from src.Controller import Controller
+from src.ControlLoop import ControlLoop
 from src.JoystickInterface import JoystickInterface
 from src.State import State
 from pupper.MovementGroup import MovementLib
 from src.MovementScheme import MovementScheme
 from pupper.HardwareInterface import HardwareInterface
 from pupper.Config import Configuration
-from pupper.Kinematics import four_legs_inverse_kinematics
+from pupper.KinematicsTable import load_inverse_kinematics
+from src.Scheduler import FixedRateScheduler
+from src.Telemetry import make_telemetry
+import UDPComms
 
 quat_orientation = np.array([1, 0, 0, 0])
 
 cartoons_folder = "/home/ubuntu/Robotics/QuadrupedRobot/Mangdang/LCD/cartoons/"
 current_show = ""
 
-with open("/home/ubuntu/.hw_version", "r") as hw_f:
-    hw_version = hw_f.readline()
 
-if hw_version == 'P1\n':
-    disp = ST7789(14, 15, 47)
-else :
-    disp = ST7789(27, 24, 26)
+def open_display():
+    """Opens the ST7789 display, whose pins depend on the hardware version"""
+    from Mangdang.LCD.ST7789 import ST7789
+
+    with open("/home/ubuntu/.hw_version", "r") as hw_f:
+        hw_version = hw_f.readline()
+
+    if hw_version == 'P1\n':
+        return ST7789(14, 15, 47)
+    return ST7789(27, 24, 26)
 
 def pic_show(disp, pic_name, _lock):
     """ Show the specify picture
@@ -61,6 +67,8 @@ def animated_thr_fun(_disp, duration, is_connect, current_leg, _lock):
     Parameter: None
     Returen: None
     """
+    from Mangdang.LCD.gif import AnimatedGif
+
     try:
         gif_player = AnimatedGif(_disp, width=320, height=240, folder=cartoons_folder)
         last_time = time.time()
@@ -110,15 +118,13 @@ def main():
     hardware_interface = HardwareInterface()
 
     # show logo
-    global disp
+    disp = open_display()
     disp.begin()
     disp.clear()
     image=Image.open(cartoons_folder + "logo.png")
     image.resize((320,240))
     disp.display(image)
     
-    shutdown_counter = 0            # counter for shuudown cmd
-    
     # Start animated process
     duration = 10
     is_connect = multiprocessing.Value('l', 0)
@@ -130,17 +136,26 @@ def main():
     #Create movement group scheme
     movement_ctl = MovementScheme(MovementLib)
 
+    telemetry = make_telemetry(config)
+
     # Create controller and user input handles
     controller = Controller(
         config,
-        four_legs_inverse_kinematics,
+        load_inverse_kinematics(config),
+        telemetry,
     )
     state = State()
+    state.quat_orientation = quat_orientation
     print("Creating joystick listener...")
     joystick_interface = JoystickInterface(config)
+    # Receive joystick messages as they arrive instead of polling the socket every tick
+    udp_poller = UDPComms.Poller()
+    if isinstance(joystick_interface.udp_handle, UDPComms.Subscriber):
+        udp_poller.register(joystick_interface.udp_handle)
+    udp_poller.start()
     print("Done.")
 
-    last_loop = time.time()
+    scheduler = FixedRateScheduler(config.dt, config.loop_spin_time)
 
     print("Summary of gait parameters:")
     print("overlap time: ", config.overlap_time)
@@ -148,69 +163,47 @@ def main():
     print("z clearance: ", config.z_clearance)
     print("x shift: ", config.x_shift)
 
+    def shutdown():
+        # shut down the system after the shutdown button was held for config.shutdown_ticks ticks
+        print('shutdown system now')
+        os.system('systemctl stop robot')
+        os.system('shutdown -h now')
+
+    control_loop = ControlLoop(
+        config,
+        joystick_interface,
+        controller,
+        hardware_interface,
+        movement_ctl,
+        state,
+        lambda picture: pic_show(disp, picture, lock),
+        telemetry,
+        shutdown,
+    )
+
     # Wait until the activate button has been pressed
     while True:
         print("Waiting for L1 to activate robot.")
-        while True:
-            command = joystick_interface.get_command(state)
-            joystick_interface.set_color(config.ps4_deactivated_color)
-            if command.activate_event == 1:
-                break
+        while not control_loop.wait_for_activation():
             time.sleep(0.1)
         print("Robot activated.")
         is_connect.value = 1
-        joystick_interface.set_color(config.ps4_color)
-        pic_show(disp, "walk.png", lock)
 
+        scheduler.start()
         while True:
-            now = time.time()
-            if now - last_loop < config.dt:
-                continue
-            last_loop = time.time()
-
-            # Parse the udp joystick commands and then update the robot controller's parameters
-            command = joystick_interface.get_command(state)
-            #cmd_dump(command)
-            _pic = "walk.png" if command.yaw_rate ==0 else "turnaround.png"
-            if command.trot_event == True:
-                _pic = "walk_r1.png"
-            pic_show(disp, _pic, lock)
-            if command.activate_event == 1:
+            scheduler.wait()
+            if not control_loop.tick():
                 is_connect.value = 0
-                pic_show(disp, "notconnect.png", lock)
                 print("Deactivating Robot")
+                print(scheduler.summary())
                 break
-            state.quat_orientation = quat_orientation
-            # movement scheme
-            movement_switch = command.dance_switch_event
-            gait_state = command.trot_event
-            dance_state = command.dance_activate_event
-            shutdown_signal = command.shutdown_signal
-            
-            #shutdown counter
-            if shutdown_signal == True:
-                shutdown_counter = shutdown_counter + 1
-                # press shut dow button more 3s(0.015*200), shut down system
-                if shutdown_counter >= 200:             
-                    print('shutdown system now')
-                    os.system('systemctl stop robot')
-                    os.system('shutdown -h now')
-
-            # gait and movement control
-            if gait_state == True or dance_state == True:       # if triger tort event, reset the movement number to 0
-                movement_ctl.resetMovementNumber()
-            movement_ctl.runMovementScheme(movement_switch)
-            food_location = movement_ctl.getMovemenLegsLocation()
-            attitude_location = movement_ctl.getMovemenAttitude()
-            robot_speed = movement_ctl.getMovemenSpeed()
-            controller.run(state,command,food_location,attitude_location,robot_speed)
-
-            # Update the pwm widths going to the servos
-            hardware_interface.set_actuator_postions(state.joint_angles)
             current_leg[0]= state.joint_angles[0][0]
             current_leg[1]= state.joint_angles[1][0]
             #current_leg[2]= state.joint_angles[2][0]
-try:
-    main()
-except KeyboardInterrupt:
-    pass
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,85 @@
+import argparse
+import cProfile
+import os
+import pstats
+import sys
+import time
+
+import numpy as np
+
+# Same module layout as on the robot, with the repository in place of /home/ubuntu/Robotics/QuadrupedRobot
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repository)
+sys.path.extend(
+    [
+        os.path.join(root, name)
+        for root, dirs, _ in os.walk(repository)
+        for name in dirs
+        if not name.startswith(".") and ".git" not in root
+    ]
+)
+from src.Simulation import Simulation
+from src.Telemetry import Telemetry
+
+
+def main():
+    """Runs the control stack headless against scripted joystick input and a recording servo sink"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--ticks", type=int, default=10000, help="number of control loop ticks to run")
+    parser.add_argument("--realtime", action="store_true", help="pace the loop at config.dt like the robot")
+    parser.add_argument("--telemetry", action="store_true", help="print per-stage timing")
+    parser.add_argument("--profile", action="store_true", help="print the functions taking the most time")
+    parser.add_argument("--save", help="save the joint angles of every tick to this .npy file")
+    parser.add_argument("--compare", help="compare the joint angles of every tick to this .npy file")
+    args = parser.parse_args()
+
+    telemetry = Telemetry() if args.telemetry else None
+    simulation = Simulation(realtime=args.realtime, telemetry=telemetry, capacity=args.ticks)
+
+    profiler = cProfile.Profile() if args.profile else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    simulation.run(args.ticks)
+    if profiler is not None:
+        profiler.disable()
+    elapsed = time.perf_counter() - start
+    simulation.close()
+
+    print(
+        "Ran {} ticks in {:.3f} s, {:.0f} ticks/s, {:.1f} us/tick, {:.1f}x real time".format(
+            args.ticks,
+            elapsed,
+            args.ticks / elapsed,
+            elapsed / args.ticks * 1e6,
+            args.ticks * simulation.config.dt / elapsed,
+        )
+    )
+    print(
+        "Servo updates: {}, channel writes: {}, final behavior state: {}".format(
+            simulation.pwm_writer.frame_count, simulation.pwm_writer.write_count, simulation.state.behavior_state
+        )
+    )
+    if telemetry is not None:
+        print(telemetry.format_summary())
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+
+    joint_angles = simulation.recorded_joint_angles()
+    if args.save:
+        np.save(args.save, joint_angles)
+        print("Saved joint angles to", args.save)
+    if args.compare:
+        reference = np.load(args.compare)
+        if reference.shape != joint_angles.shape:
+            print("Joint angle shapes differ:", reference.shape, joint_angles.shape)
+            sys.exit(1)
+        difference = np.abs(np.nan_to_num(joint_angles) - np.nan_to_num(reference)).max()
+        nan_mismatch = np.count_nonzero(np.isnan(joint_angles) != np.isnan(reference))
+        print("Largest joint angle difference: {:.3g} rad, NaN mismatches: {}".format(difference, nan_mismatch))
+        if difference > 1e-9 or nan_mismatch:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
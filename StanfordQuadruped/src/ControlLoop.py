@@ -0,0 +1,93 @@
+from src.Telemetry import NullTelemetry
+
+
+class ControlLoop:
+    """One tick of the robot's control loop: joystick, display, movement scheme, controller and servos.
+
+    run_robot.py drives it with the robot's hardware and src/Simulation.py with in-memory
+    fakes, so both run the same code.
+    """
+
+    def __init__(
+        self,
+        config,
+        joystick_interface,
+        controller,
+        hardware_interface,
+        movement_ctl,
+        state,
+        show_picture,
+        telemetry=None,
+        on_shutdown=None,
+    ):
+        """
+        Parameters
+        ----------
+        show_picture : callable
+            Called with the file name of the cartoon to show on the display.
+        telemetry : Telemetry, optional
+            Stage timing of the loop, disabled if None.
+        on_shutdown : callable, optional
+            Called once the shutdown button has been held for config.shutdown_ticks ticks.
+        """
+        self.config = config
+        self.joystick_interface = joystick_interface
+        self.controller = controller
+        self.hardware_interface = hardware_interface
+        self.movement_ctl = movement_ctl
+        self.state = state
+        self.show_picture = show_picture
+        self.telemetry = NullTelemetry() if telemetry is None else telemetry
+        self.on_shutdown = on_shutdown
+        self.shutdown_counter = 0
+
+    def wait_for_activation(self):
+        """Checks the joystick once while the robot is deactivated. Returns True when L1 activates it"""
+        command = self.joystick_interface.get_command(self.state)
+        self.joystick_interface.set_color(self.config.ps4_deactivated_color)
+        if command.activate_event != 1:
+            return False
+        self.joystick_interface.set_color(self.config.ps4_color)
+        self.show_picture("walk.png")
+        return True
+
+    def tick(self):
+        """Runs one tick of the active robot. Returns False when L1 deactivates it"""
+        telemetry = self.telemetry
+        state = self.state
+        telemetry.start_tick()
+
+        # Parse the udp joystick commands and then update the robot controller's parameters
+        command = self.joystick_interface.get_command(state)
+        telemetry.mark("joystick")
+        picture = "walk.png" if command.yaw_rate == 0 else "turnaround.png"
+        if command.trot_event == True:
+            picture = "walk_r1.png"
+        self.show_picture(picture)
+        telemetry.mark("display")
+        if command.activate_event == 1:
+            self.show_picture("notconnect.png")
+            return False
+
+        # Holding the shutdown button for shutdown_ticks ticks shuts the robot down
+        if command.shutdown_signal == True:
+            self.shutdown_counter += 1
+            if self.shutdown_counter == self.config.shutdown_ticks and self.on_shutdown is not None:
+                self.on_shutdown()
+
+        # gait and movement control
+        if command.trot_event == True or command.dance_activate_event == True:
+            # if triger tort event, reset the movement number to 0
+            self.movement_ctl.resetMovementNumber()
+        self.movement_ctl.runMovementScheme(command.dance_switch_event)
+        food_location = self.movement_ctl.getMovemenLegsLocation()
+        attitude_location = self.movement_ctl.getMovemenAttitude()
+        robot_speed = self.movement_ctl.getMovemenSpeed()
+        telemetry.mark("movement")
+        self.controller.run(state, command, food_location, attitude_location, robot_speed)
+
+        # Update the pwm widths going to the servos
+        self.hardware_interface.set_actuator_postions(state.joint_angles)
+        telemetry.mark("servo")
+        telemetry.end_tick()
+        return True
@@ -1,14 +1,12 @@
 from src.Gaits import GaitController
-#from src.GaitScheme import GaitScheme
 from src.StanceController import StanceController
 from src.SwingLegController import SwingController
 from src.Utilities import clipped_first_order_filter
 from src.State import BehaviorState, State
+from src.Rotations import CachedRotation, quat_to_euler
+from src.Telemetry import NullTelemetry
 
 import numpy as np
-from transforms3d.euler import euler2mat, quat2euler
-from transforms3d.quaternions import qconjugate, quat2axangle
-from transforms3d.axangles import axangle2mat
 
 
 class Controller:
@@ -19,8 +17,10 @@ class Controller:
         self,
         config,
         inverse_kinematics,
+        telemetry=None,
     ):
         self.config = config
+        self.telemetry = NullTelemetry() if telemetry is None else telemetry
 
         self.smoothed_yaw = 0.0  # for REST mode only
         self.inverse_kinematics = inverse_kinematics
@@ -28,11 +28,18 @@ class Controller:
 
         self.contact_modes = np.zeros(4)
         self.gait_controller = GaitController(self.config)
-        #self.gait_controller = GaitScheme(1) 
-        #self.gait_controller.setCurrentGait('Trotting')
-        self.swing_controller = SwingController(self.config)
+        self.swing_controller = SwingController(self.config, self.gait_controller)
         self.stance_controller = StanceController(self.config)
 
+        # Scratch buffers reused every timestep
+        self.stance_foot_locations = np.zeros((3, 4))
+        self.swing_foot_locations = np.zeros((3, 4))
+        self.stance_mask = np.zeros(4, dtype=bool)
+        self.rotated_foot_locations = np.zeros((3, 4))
+        self.compensated_foot_locations = np.zeros((3, 4))
+        self.body_rotation = CachedRotation()
+        self.tilt_rotation = CachedRotation()
+
         self.hop_transition_mapping = {BehaviorState.REST: BehaviorState.HOP, BehaviorState.HOP: BehaviorState.FINISHHOP, BehaviorState.FINISHHOP: BehaviorState.REST, BehaviorState.TROT: BehaviorState.HOP}
         self.trot_transition_mapping = {BehaviorState.REST: BehaviorState.TROT, BehaviorState.TROT: BehaviorState.REST, BehaviorState.HOP: BehaviorState.TROT, BehaviorState.FINISHHOP: BehaviorState.TROT}
         self.activate_transition_mapping = {BehaviorState.DEACTIVATED: BehaviorState.REST, BehaviorState.REST: BehaviorState.DEACTIVATED}
@@ -56,40 +63,50 @@ class Controller:
         Numpy array (3, 4)
             Matrix of new foot locations.
         """
+        self.gait_controller.update(state.ticks)
         contact_modes = self.gait_controller.contacts(state.ticks)
-        
-        #if command.gait_switch_event == 1:
-        #    self.gait_controller.switchGait()
-        #self.gait_controller.updateGaitScheme()
-        #contact_modes = self.gait_controller.current_leg_state 
-        
-        new_foot_locations = np.zeros((3, 4))
-        for leg_index in range(4):
-            contact_mode = contact_modes[leg_index]
-            foot_location = state.foot_locations[:, leg_index]
-            if contact_mode == 1:
-                new_location = self.stance_controller.next_foot_location(leg_index, state, command)
-            else:
-                swing_proportion = (
-                    self.gait_controller.subphase_ticks(state.ticks) / self.config.swing_ticks
-                )
-                
-                #leg_progress = self.gait_controller.current_leg_progress
-                #swing_proportion = leg_progress[leg_index]
-                
-                new_location = self.swing_controller.next_foot_location(
-                    swing_proportion,
-                    leg_index,
-                    state,
-                    command
-                )
-            new_foot_locations[:, leg_index] = new_location
-        return new_foot_locations, contact_modes
+        swing_proportions = self.gait_controller.swing_proportion(state.ticks)
+
+        stance_locations = self.stance_controller.next_foot_locations(
+            state, command, out=self.stance_foot_locations
+        )
+        swing_locations = self.swing_controller.next_foot_locations(
+            swing_proportions,
+            state,
+            command,
+            out=self.swing_foot_locations,
+        )
+
+        # Update the foot locations in place, picking each foot's column by its contact mode
+        np.equal(contact_modes, 1, out=self.stance_mask)
+        np.copyto(state.foot_locations, swing_locations)
+        np.copyto(state.foot_locations, stance_locations, where=self.stance_mask)
+        return state.foot_locations, contact_modes
+
+
+    def compensate_tilt(self, state, foot_locations):
+        """Rotate the foot locations to compensate for the measured body tilt
+
+        Returns
+        -------
+        Numpy array (3, 4)
+            The controller's compensated_foot_locations buffer.
+        """
+        (roll, pitch, yaw) = quat_to_euler(state.quat_orientation)
+        correction_factor = 0.8
+        max_tilt = 0.4
+        roll_compensation = correction_factor * min(max(-roll, -max_tilt), max_tilt)
+        pitch_compensation = correction_factor * min(max(-pitch, -max_tilt), max_tilt)
+        rmat = self.tilt_rotation.update(roll_compensation, pitch_compensation, 0.0)
+        return np.dot(rmat.T, foot_locations, out=self.compensated_foot_locations)
 
 
     def run(self, state, command,location,attitude,robot_speed):
         """Steps the controller forward one timestep
 
+        Foot locations and joint angles are written into state.foot_locations and
+        state.joint_angles in place, intermediate results into the controller's scratch buffers.
+
         Parameters
         ----------
         controller : Controller
@@ -106,52 +123,47 @@ class Controller:
 
         # check dance active event
         self.dance_active(command)
+
+        # Switch to the next gait of config.gait_cycle at the end of the current gait phase
+        if command.gait_switch_event:
+            self.gait_controller.switch_gait()
         
         if state.behavior_state == BehaviorState.TROT:
-            state.foot_locations, contact_modes = self.step_gait(
+            self.step_gait(
                 state,
                 command,
             )
+            self.telemetry.mark("gait")
 
             # Apply the desired body rotation
-            rotated_foot_locations = (
-                euler2mat(
-                    command.roll, command.pitch, 0.0
-                )
-                @ state.foot_locations
+            rotated_foot_locations = np.dot(
+                self.body_rotation.update(command.roll, command.pitch, 0.0),
+                state.foot_locations,
+                out=self.rotated_foot_locations,
             )
 
-            # Construct foot rotation matrix to compensate for body tilt
-            (roll, pitch, yaw) = quat2euler(state.quat_orientation)
-            correction_factor = 0.8
-            max_tilt = 0.4
-            roll_compensation = correction_factor * np.clip(-roll, -max_tilt, max_tilt)
-            pitch_compensation = correction_factor * np.clip(-pitch, -max_tilt, max_tilt)
-            rmat = euler2mat(roll_compensation, pitch_compensation, 0)
-
-            rotated_foot_locations = rmat.T @ rotated_foot_locations
-
-            state.joint_angles = self.inverse_kinematics(
-                rotated_foot_locations, self.config
+            self.inverse_kinematics(
+                self.compensate_tilt(state, rotated_foot_locations),
+                self.config,
+                out=state.joint_angles,
             )
+            self.telemetry.mark("ik")
 
         elif state.behavior_state == BehaviorState.HOP:
-            state.foot_locations = (
-                self.config.default_stance
-                + np.array([0, 0, -0.03])[:, np.newaxis]
-            )
-            state.joint_angles = self.inverse_kinematics(
-                state.foot_locations, self.config
+            state.foot_locations[:] = self.config.compiled.default_stance
+            state.foot_locations[2] += -0.03
+            self.inverse_kinematics(
+                state.foot_locations, self.config, out=state.joint_angles
             )
+            self.telemetry.mark("ik")
 
         elif state.behavior_state == BehaviorState.FINISHHOP:
-            state.foot_locations = (
-                self.config.default_stance
-                + np.array([0, 0, -0.105])[:, np.newaxis]
-            )
-            state.joint_angles = self.inverse_kinematics(
-                state.foot_locations, self.config
+            state.foot_locations[:] = self.config.compiled.default_stance
+            state.foot_locations[2] += -0.105
+            self.inverse_kinematics(
+                state.foot_locations, self.config, out=state.joint_angles
             )
+            self.telemetry.mark("ik")
 
         elif state.behavior_state == BehaviorState.REST:
             yaw_proportion = command.yaw_rate / self.config.max_yaw_rate
@@ -164,70 +176,47 @@ class Controller:
                     self.config.yaw_time_constant,
                 )
             )
-            # Set the foot locations to the default stance plus the standard height
-            print('act:',self.dance_active_state)
-            #self.dance_active_state = True
             if self.dance_active_state == False:
+                # Set the foot locations to the default stance plus the standard height
+                state.foot_locations[:] = self.config.compiled.default_stance
+                state.foot_locations[2] += command.height
+                body_roll = command.roll
+                body_pitch = command.pitch
 
-                state.foot_locations = (self.config.default_stance + np.array([0, 0, command.height])[:, np.newaxis])
-                # Apply the desired body rotation
-                rotated_foot_locations = (
-                    euler2mat(
-                        command.roll,
-                        command.pitch,
-                        self.smoothed_yaw,
-                    )
-                    @ state.foot_locations
-                )
-                
             else:
-  
-                location_buf = np.zeros((3, 4))
-                for index_i in range(3):
-                    for index_j in range(4):
-                        location_buf[index_i,index_j] = location[index_i][index_j]
                 if (abs(robot_speed[0])<0.01) and (abs(robot_speed[1])<0.01):
-                    state.foot_locations = location_buf
+                    state.foot_locations[:] = location
                 else:
                     command.horizontal_velocity[0] = robot_speed[0]
                     command.horizontal_velocity[1] = robot_speed[1]
-                    state.foot_locations, contact_modes = self.step_gait(state,command)
-                # Apply the desired body rotation
-                rotated_foot_locations = (
-                    euler2mat(
-                        attitude[0],
-                        attitude[1],
-                        self.smoothed_yaw,
-                    )
-                    @ state.foot_locations
-                )
-                
-            state.joint_angles = self.inverse_kinematics(
-                rotated_foot_locations, self.config
-            )
-
- # Construct foot rotation matrix to compensate for body tilt
-            (roll, pitch, yaw) = quat2euler(state.quat_orientation)
-            correction_factor = 0.8
-            max_tilt = 0.4
-            roll_compensation = correction_factor * np.clip(-roll, -max_tilt, max_tilt)
-            pitch_compensation = correction_factor * np.clip(-pitch, -max_tilt, max_tilt)
-            rmat = euler2mat(roll_compensation, pitch_compensation, 0)
+                    self.step_gait(state,command)
+                body_roll = attitude[0]
+                body_pitch = attitude[1]
+            self.telemetry.mark("gait")
 
-            rotated_foot_locations = rmat.T @ rotated_foot_locations
+            # Apply the desired body rotation
+            rotated_foot_locations = np.dot(
+                self.body_rotation.update(body_roll, body_pitch, self.smoothed_yaw),
+                state.foot_locations,
+                out=self.rotated_foot_locations,
+            )
 
-            state.joint_angles = self.inverse_kinematics(
-                rotated_foot_locations, self.config
+            self.inverse_kinematics(
+                self.compensate_tilt(state, rotated_foot_locations),
+                self.config,
+                out=state.joint_angles,
             )
+            self.telemetry.mark("ik")
 
         state.ticks += 1
         state.pitch = command.pitch
         state.roll = command.roll
         state.height = command.height
+        self.telemetry.mark("controller")
 
     def set_pose_to_default(self):
         state.foot_locations = (
-            self.config.default_stance
+            self.config.compiled.default_stance
             + np.array([0, 0, self.config.default_z_ref])[:, np.newaxis]
         )
         state.joint_angles = controller.inverse_kinematics(
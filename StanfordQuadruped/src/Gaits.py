@@ -1,30 +1,164 @@
+import numpy as np
+
+
+class Gait:
+    """Contact pattern of a gait.
+
+    Phases where all four feet are on the ground last config.overlap_time, every other phase
+    lasts config.swing_time.
+    """
+
+    def __init__(self, name, contact_phases):
+        """
+        Parameters
+        ----------
+        name : str
+            Name of the gait, used as its key in the gait registry.
+        contact_phases : numpy array (4, num_phases), or None
+            Contact mode of each foot in each phase, 0 indicating flight and 1 indicating stance.
+            None uses config.contact_phases.
+        """
+        self.name = name
+        self.contact_phases = None if contact_phases is None else np.array(contact_phases)
+
+
+# Registered gaits. gait_switch_event cycles through the ones in config.gait_cycle
+GAITS = {}
+
+
+def register_gait(gait):
+    GAITS[gait.name] = gait
+    return gait
+
+
+register_gait(Gait("trot", None))
+# Lateral sequence walk: back right, front right, back left, front left
+register_gait(Gait("walk", [[1, 0, 1, 1], [1, 1, 1, 0], [0, 1, 1, 1], [1, 1, 0, 1]]))
+register_gait(Gait("pace", [[1, 0, 1, 1], [1, 1, 1, 0], [1, 0, 1, 1], [1, 1, 1, 0]]))
+register_gait(Gait("bound", [[1, 0, 1, 1], [1, 0, 1, 1], [1, 1, 1, 0], [1, 1, 1, 0]]))
+register_gait(Gait("pronk", [[1, 0], [1, 0], [1, 0], [1, 0]]))
+
+
+class GaitTable:
+    """Per-tick gait queries over one period of a gait, precomputed for a configuration."""
+
+    def __init__(self, gait, config):
+        compiled = config.compiled
+        contact_phases = config.contact_phases if gait.contact_phases is None else gait.contact_phases
+        overlap_phases = np.all(contact_phases == 1, axis=0)
+        phase_ticks = np.where(overlap_phases, compiled.overlap_ticks, compiled.swing_ticks)
+        phase_starts = np.cumsum(phase_ticks) - phase_ticks
+
+        self.name = gait.name
+        self.phase_length = int(phase_ticks.sum())
+        self.phase_table = np.repeat(np.arange(contact_phases.shape[1]), phase_ticks)
+        self.subphase_table = np.arange(self.phase_length) - phase_starts[self.phase_table]
+        self.contact_table = np.ascontiguousarray(contact_phases[:, self.phase_table].T)
+        self.swing_proportion_table = swing_proportions(self.contact_table)
+        # Row views made once, indexing the tables would make a new view every query
+        self.contact_rows = list(self.contact_table)
+        self.swing_proportion_rows = list(self.swing_proportion_table)
+
+        # Every registered gait swings for one phase, so these are the same for all feet
+        self.swing_ticks = compiled.swing_ticks
+        self.stance_ticks = self.phase_length - self.swing_ticks
+
+
 class GaitController:
-    def __init__(self, config):
+    def __init__(self, config, gait_name="trot"):
         self.config = config
+        self.compiled = None
+        self.gait_name = gait_name
+        self.next_gait_name = None
+        # Tick at which the current gait's period started, so a new gait starts at its first phase
+        self.start_tick = 0
+        self.update_tables()
+
+
+    def update_tables(self):
+        """Precomputes the gait queries for every tick of one period of every registered gait.
+
+        The tables are rebuilt automatically when the configuration changes, so each query
+        is a single table lookup and neither queries nor gait switches allocate.
+        """
+        compiled = self.config.compiled
+        self.tables = {name: GaitTable(gait, self.config) for name, gait in GAITS.items()}
+        self.set_table(self.tables[self.gait_name])
+        self.compiled = compiled
+
+
+    def set_table(self, table):
+        self.table = table
+        self.phase_length = table.phase_length
+        self.phase_table = table.phase_table
+        self.subphase_table = table.subphase_table
+        self.contact_table = table.contact_table
+        self.swing_proportion_table = table.swing_proportion_table
+        self.contact_rows = table.contact_rows
+        self.swing_proportion_rows = table.swing_proportion_rows
+        self.swing_ticks = table.swing_ticks
+        self.stance_ticks = table.stance_ticks
+
+
+    def switch_gait(self, gait_name=None):
+        """Requests a gait switch, which happens at the start of the current gait's next phase.
+
+        Every swing ends with its phase, so at a phase boundary all feet are on the ground or
+        touching down and the new gait can start at its first phase. The switch waits at most
+        one phase, config.swing_time or config.overlap_time.
+
+        Parameters
+        ----------
+        gait_name : str, optional
+            Name of a registered gait. None picks the gait after the current one in
+            config.gait_cycle, or the first one of the cycle if the current gait is not in it.
+        """
+        if gait_name is None:
+            cycle = list(self.config.gait_cycle)
+            if self.gait_name in cycle:
+                gait_name = cycle[(cycle.index(self.gait_name) + 1) % len(cycle)]
+            else:
+                gait_name = cycle[0]
+        if gait_name not in self.tables:
+            raise KeyError("Unknown gait " + str(gait_name) + ", registered gaits are " + str(list(self.tables)))
+        self.next_gait_name = gait_name
+
+
+    def update(self, ticks):
+        """Applies a requested gait switch if the current gait is at a phase boundary.
+
+        Parameters
+        ----------
+        ticks : Int
+            Number of timesteps since the program started.
+        """
+        if self.next_gait_name is not None and self.subphase_table[self.phase_time(ticks)] == 0:
+            self.gait_name = self.next_gait_name
+            self.next_gait_name = None
+            self.start_tick = ticks
+            self.set_table(self.tables[self.gait_name])
+
+
+    def phase_time(self, ticks):
+        if self.compiled is not self.config.compiled:
+            self.update_tables()
+        return (ticks - self.start_tick) % self.phase_length
 
 
     def phase_index(self, ticks):
         """Calculates which part of the gait cycle the robot should be in given the time in ticks.
-        
+
         Parameters
         ----------
         ticks : int
             Number of timesteps since the program started
-        gaitparams : GaitParams
-            GaitParams object
-        
+
         Returns
         -------
         Int
             The index of the gait phase that the robot should be in.
         """
-        phase_time = ticks % self.config.phase_length
-        phase_sum = 0
-        for i in range(self.config.num_phases):
-            phase_sum += self.config.phase_ticks[i]
-            if phase_time < phase_sum:
-                return i
-        assert False
+        return self.phase_table[self.phase_time(ticks)]
 
 
     def subphase_ticks(self, ticks):
@@ -34,38 +168,74 @@ class GaitController:
         ----------
         ticks : Int
             Number of timesteps since the program started
-        gaitparams : GaitParams
-            GaitParams object
-        
+
         Returns
         -------
         Int
             Number of ticks since the start of the current phase.
         """
-        phase_time = ticks % self.config.phase_length
-        phase_sum = 0
-        subphase_ticks = 0
-        for i in range(self.config.num_phases):
-            phase_sum += self.config.phase_ticks[i]
-            if phase_time < phase_sum:
-                subphase_ticks = phase_time - phase_sum + self.config.phase_ticks[i]
-                return subphase_ticks
-        assert False
+        return self.subphase_table[self.phase_time(ticks)]
 
 
     def contacts(self, ticks):
         """Calculates which feet should be in contact at the given number of ticks
-        
+
         Parameters
         ----------
         ticks : Int
             Number of timesteps since the program started.
-        gaitparams : GaitParams
-            GaitParams object
-        
+
         Returns
         -------
         numpy array (4,)
             Numpy vector with 0 indicating flight and 1 indicating stance.
         """
-        return self.config.contact_phases[:, self.phase_index(ticks)]
+        return self.contact_rows[self.phase_time(ticks)]
+
+
+    def swing_proportion(self, ticks):
+        """Calculates how far through its swing each foot is at the given number of ticks
+
+        Parameters
+        ----------
+        ticks : Int
+            Number of timesteps since the program started.
+
+        Returns
+        -------
+        numpy array (4,)
+            Fraction of the swing completed by each foot, in [0, 1). Zero for feet in stance.
+        """
+        return self.swing_proportion_rows[self.phase_time(ticks)]
+
+
+def swing_proportions(contact_table):
+    """Calculates, for every tick of a gait period, the fraction of the current swing each foot has completed.
+
+    Parameters
+    ----------
+    contact_table : numpy array (phase_length, 4)
+        Contact mode of each foot at each tick, 0 indicating flight and 1 indicating stance.
+
+    Returns
+    -------
+    numpy array (phase_length, 4)
+        Ticks since the foot lifted off divided by the length of that swing. Zero during stance.
+    """
+    phase_length = contact_table.shape[0]
+    proportions = np.zeros(contact_table.shape)
+    for leg_index in range(contact_table.shape[1]):
+        swinging = contact_table[:, leg_index] == 0
+        if not swinging.any():
+            continue
+        # Walk the period starting at a stance tick so swings that wrap around stay in one piece
+        start = np.argmin(swinging) if not swinging.all() else 0
+        swing_ticks = []
+        for tick in list((np.arange(phase_length) + start) % phase_length) + [None]:
+            if tick is not None and swinging[tick]:
+                swing_ticks.append(tick)
+                continue
+            for n, swing_tick in enumerate(swing_ticks):
+                proportions[swing_tick, leg_index] = n / len(swing_ticks)
+            swing_ticks = []
+    return proportions
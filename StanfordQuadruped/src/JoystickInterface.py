@@ -8,8 +8,15 @@ from src.Utilities import deadband, clipped_first_order_filter
 
 class JoystickInterface:
     def __init__(
-        self, config, udp_port=8830, udp_publisher_port = 8840,
+        self, config, udp_port=8830, udp_publisher_port = 8840, udp_handle=None, udp_publisher=None,
     ):
+        """
+        Parameters
+        ----------
+        udp_handle, udp_publisher : optional
+            Objects used instead of a UDPComms Subscriber on udp_port and Publisher on
+            udp_publisher_port, e.g. the scripted joystick of src/Simulation.py.
+        """
         self.config = config
         self.previous_gait_toggle = 0
         self.previous_state = BehaviorState.REST
@@ -21,13 +28,27 @@ class JoystickInterface:
         self.previous_gait_switch_toggle = 0
 
         self.message_rate = 50
-        self.udp_handle = UDPComms.Subscriber(udp_port, timeout=0.3)
-        self.udp_publisher = UDPComms.Publisher(udp_publisher_port,65532)
+        if config.joystick_transport == "shm":
+            subscriber, publisher = UDPComms.LocalSubscriber, UDPComms.LocalPublisher
+        else:
+            subscriber, publisher = UDPComms.Subscriber, UDPComms.Publisher
+        if udp_handle is None:
+            udp_handle = subscriber(udp_port, timeout=0.3)
+        if udp_publisher is None:
+            udp_publisher = publisher(udp_publisher_port,65532)
+        self.udp_handle = udp_handle
+        self.udp_publisher = udp_publisher
 
 
     def get_command(self, state, do_print=False):
         try:
             msg = self.udp_handle.get()
+            # Messages from a sequenced publisher carry their send time, ignore stale ones
+            stats = getattr(self.udp_handle, "stats", None)
+            if stats is not None and stats.received and stats.message_age() > self.config.max_command_age:
+                if do_print:
+                    print("Stale joystick message, sent", stats.message_age(), "s ago")
+                return Command()
             command = Command()
 
             ####### Handle discrete commands ########
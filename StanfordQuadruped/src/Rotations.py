@@ -0,0 +1,140 @@
+import math
+
+import numpy as np
+
+_FLOAT_EPS = np.finfo(float).eps
+_EPS4 = _FLOAT_EPS * 4.0
+
+
+def euler_matrix(roll, pitch, yaw, out=None):
+    """Rotation matrix for static x, y, z Euler angles, same as transforms3d.euler.euler2mat(roll, pitch, yaw)
+
+    Parameters
+    ----------
+    roll, pitch, yaw : float
+        Rotation angles about the x, y and z axes in radians.
+    out : numpy array (3,3), optional
+        Preallocated array the matrix is written into. A new array is allocated if None.
+
+    Returns
+    -------
+    numpy array (3,3)
+        Rotation matrix Rz(yaw) @ Ry(pitch) @ Rx(roll).
+    """
+    if out is None:
+        out = np.empty((3, 3))
+    si, sj, sk = math.sin(roll), math.sin(pitch), math.sin(yaw)
+    ci, cj, ck = math.cos(roll), math.cos(pitch), math.cos(yaw)
+    cc, cs = ci * ck, ci * sk
+    sc, ss = si * ck, si * sk
+    out[0, 0] = cj * ck
+    out[0, 1] = sj * sc - cs
+    out[0, 2] = sj * cc + ss
+    out[1, 0] = cj * sk
+    out[1, 1] = sj * ss + cc
+    out[1, 2] = sj * cs - sc
+    out[2, 0] = -sj
+    out[2, 1] = cj * si
+    out[2, 2] = cj * ci
+    return out
+
+
+def roll_pitch_matrix(roll, pitch, out=None):
+    """Rotation matrix for a roll followed by a pitch, same as euler_matrix(roll, pitch, 0)"""
+    if out is None:
+        out = np.empty((3, 3))
+    si, sj = math.sin(roll), math.sin(pitch)
+    ci, cj = math.cos(roll), math.cos(pitch)
+    out[0, 0] = cj
+    out[0, 1] = sj * si
+    out[0, 2] = sj * ci
+    out[1, 0] = 0.0
+    out[1, 1] = ci
+    out[1, 2] = -si
+    out[2, 0] = -sj
+    out[2, 1] = cj * si
+    out[2, 2] = cj * ci
+    return out
+
+
+def yaw_matrix(yaw, out=None):
+    """Rotation matrix about the z axis, same as euler_matrix(0, 0, yaw)"""
+    if out is None:
+        out = np.empty((3, 3))
+    sk, ck = math.sin(yaw), math.cos(yaw)
+    out[0, 0] = ck
+    out[0, 1] = -sk
+    out[0, 2] = 0.0
+    out[1, 0] = sk
+    out[1, 1] = ck
+    out[1, 2] = 0.0
+    out[2, 0] = 0.0
+    out[2, 1] = 0.0
+    out[2, 2] = 1.0
+    return out
+
+
+def quat_to_euler(quat):
+    """Static x, y, z Euler angles of a quaternion, same as transforms3d.euler.quat2euler(quat)
+
+    Parameters
+    ----------
+    quat : sequence (4)
+        Quaternion in w, x, y, z order.
+
+    Returns
+    -------
+    (float, float, float)
+        (roll, pitch, yaw) in radians.
+    """
+    # Plain floats, numpy scalar arithmetic is much slower. tolist() makes them without
+    # the iterator map(float, quat) would allocate
+    (w, x, y, z) = np.asarray(quat, dtype=float).tolist()
+    Nq = w * w + x * x + y * y + z * z
+    if Nq < _FLOAT_EPS:
+        return (0.0, 0.0, 0.0)
+    s = 2.0 / Nq
+    X = x * s
+    Y = y * s
+    Z = z * s
+    wX = w * X; wY = w * Y; wZ = w * Z
+    xX = x * X; xY = x * Y; xZ = x * Z
+    yY = y * Y; yZ = y * Z; zZ = z * Z
+
+    # Only the matrix entries the Euler angles depend on
+    m00 = 1.0 - (yY + zZ)
+    m10 = xY + wZ
+    m11 = 1.0 - (xX + zZ)
+    m12 = yZ - wX
+    m20 = xZ - wY
+    m21 = yZ + wX
+    m22 = 1.0 - (xX + yY)
+
+    cy = math.sqrt(m00 * m00 + m10 * m10)
+    if cy > _EPS4:
+        return (math.atan2(m21, m22), math.atan2(-m20, cy), math.atan2(m10, m00))
+    return (math.atan2(-m12, m11), math.atan2(-m20, cy), 0.0)
+
+
+class CachedRotation:
+    """A rotation matrix buffer that is only rebuilt when its angles change.
+
+    Picks the yaw-only or roll-pitch builder when the other angles are zero.
+    """
+
+    def __init__(self):
+        self.matrix = np.eye(3)
+        self.angles = (0.0, 0.0, 0.0)
+
+    def update(self, roll, pitch, yaw):
+        """Returns the rotation matrix for the given static x, y, z Euler angles"""
+        angles = (roll, pitch, yaw)
+        if angles != self.angles:
+            if roll == 0 and pitch == 0:
+                yaw_matrix(yaw, out=self.matrix)
+            elif yaw == 0:
+                roll_pitch_matrix(roll, pitch, out=self.matrix)
+            else:
+                euler_matrix(roll, pitch, yaw, out=self.matrix)
+            self.angles = angles
+        return self.matrix
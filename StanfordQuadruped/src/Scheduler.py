@@ -0,0 +1,122 @@
+import math
+import time
+
+
+class FixedRateScheduler:
+    """Runs a loop at a fixed rate by sleeping until absolute deadlines.
+
+    Deadlines are multiples of the period from start(), so the rate does not drift with
+    the loop's own run time. A late tick runs immediately and the following ticks keep
+    the original phase. Ticks missed entirely are skipped rather than run in a burst.
+    """
+
+    def __init__(self, period, spin_time=0.0, clock=time.monotonic, sleep=time.sleep):
+        """
+        Parameters
+        ----------
+        period : float
+            Loop period [s].
+        spin_time : float
+            Busy-wait this long before each deadline instead of sleeping, to wake up on
+            time despite the sleep's wake-up latency [s]. 0 only sleeps.
+        clock, sleep : callable
+            Monotonic clock and sleep functions, replaceable to run without real time.
+        """
+        self.period = period
+        self.spin_time = spin_time
+        self.clock = clock
+        self.sleep = sleep
+        self.start()
+
+    def start(self):
+        """Restarts the deadlines from now and clears the statistics"""
+        self.deadline = self.clock()
+        self.last_wake = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.period_count = 0
+        self.overruns = 0
+        self.missed_ticks = 0
+        self.period_sum = 0.0
+        self.period_sum_sq = 0.0
+        self.min_period = math.inf
+        self.max_period = 0.0
+        self.lateness_sum = 0.0
+        self.max_lateness = 0.0
+
+    def wait(self):
+        """Blocks until the next deadline
+
+        Returns
+        -------
+        float
+            Time the loop woke up, on the scheduler's clock.
+        """
+        self.deadline += self.period
+        now = self.clock()
+        if now > self.deadline:
+            self.overruns += 1
+            missed = int((now - self.deadline) // self.period)
+            self.missed_ticks += missed
+            self.deadline += missed * self.period
+        else:
+            sleep_time = self.deadline - self.spin_time - now
+            if sleep_time > 0:
+                self.sleep(sleep_time)
+            now = self.clock()
+            while now < self.deadline:
+                now = self.clock()
+
+        lateness = now - self.deadline
+        self.lateness_sum += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        if self.last_wake is not None:
+            period = now - self.last_wake
+            self.period_count += 1
+            self.period_sum += period
+            self.period_sum_sq += period * period
+            self.min_period = min(self.min_period, period)
+            self.max_period = max(self.max_period, period)
+        self.last_wake = now
+        self.ticks += 1
+        return now
+
+    def stats(self):
+        """Achieved loop timing since the last start() or reset_stats()
+
+        Returns
+        -------
+        dict
+            Mean, standard deviation (jitter), min and max of the achieved period, mean and max
+            lateness of the wake-ups past their deadline, and the overrun and missed tick counts. [s]
+        """
+        periods = self.period_count
+        mean_period = self.period_sum / periods if periods > 0 else 0.0
+        variance = self.period_sum_sq / periods - mean_period * mean_period if periods > 0 else 0.0
+        return {
+            "ticks": self.ticks,
+            "mean_period": mean_period,
+            "jitter": math.sqrt(max(variance, 0.0)),
+            "min_period": self.min_period if periods > 0 else 0.0,
+            "max_period": self.max_period,
+            "mean_lateness": self.lateness_sum / self.ticks if self.ticks else 0.0,
+            "max_lateness": self.max_lateness,
+            "overruns": self.overruns,
+            "missed_ticks": self.missed_ticks,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (
+            "Loop timing: {ticks} ticks, period {mean_ms:.3f} ms (min {min_ms:.3f}, max {max_ms:.3f}), "
+            "jitter {jitter_ms:.3f} ms, max lateness {late_ms:.3f} ms, {overruns} overruns, {missed_ticks} missed ticks"
+        ).format(
+            mean_ms=stats["mean_period"] * 1e3,
+            min_ms=stats["min_period"] * 1e3,
+            max_ms=stats["max_period"] * 1e3,
+            jitter_ms=stats["jitter"] * 1e3,
+            late_ms=stats["max_lateness"] * 1e3,
+            **stats
+        )
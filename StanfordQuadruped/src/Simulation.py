@@ -0,0 +1,249 @@
+import numpy as np
+
+from pupper.Config import Configuration, PWMParams
+from pupper.HardwareInterface import HardwareInterface
+from pupper.KinematicsTable import load_inverse_kinematics
+from pupper.MovementGroup import MovementLib
+from src.Controller import Controller
+from src.ControlLoop import ControlLoop
+from src.JoystickInterface import JoystickInterface
+from src.MovementScheme import MovementScheme
+from src.Scheduler import FixedRateScheduler
+from src.State import State
+from src.Telemetry import NullTelemetry
+
+# Joystick message with nothing pressed, as sent by the PS4 joystick daemon
+NEUTRAL_JOYSTICK_MESSAGE = {
+    "L1": 0, "R1": 0, "L2": 0, "R2": 0,
+    "x": 0, "circle": 0, "triangle": 0, "square": 0,
+    "lx": 0.0, "ly": 0.0, "rx": 0.0, "ry": 0.0,
+    "dpadx": 0, "dpady": 0,
+    "message_rate": 20,
+}
+
+
+def press(tick, button):
+    """Script events pressing a button at tick and releasing it on the next tick"""
+    return [(tick, {button: 1}), (tick + 1, {button: 0})]
+
+
+def default_script():
+    """Exercises every behavior state once: trot with a gait switch, body pose, dance, hop and deactivation
+
+    Returns
+    -------
+    (list of (int, dict), int)
+        Script events and the length of the script in ticks.
+    """
+    events = (
+        press(0, "L1")
+        + press(20, "R1")
+        + [(40, {"ly": 0.6}), (300, {"rx": 0.3}), (500, {"lx": -0.2})]
+        + press(600, "R2")
+        + [(900, {"ly": 0.0, "lx": 0.0, "rx": 0.0})]
+        + press(900, "R1")
+        + [(950, {"ry": 0.5, "dpadx": 1}), (1000, {"ry": 0.0, "dpadx": 0})]
+        + press(1000, "circle")
+        + press(1200, "L2")
+        + press(1400, "circle")
+        + press(1450, "x")
+        + press(1470, "x")
+        + press(1490, "x")
+        + press(1600, "L1")
+    )
+    return sorted(events, key=lambda event: event[0]), 1700
+
+
+class ScriptedJoystick:
+    """Replaces the joystick's UDPComms Subscriber with messages replayed from a script"""
+
+    def __init__(self, events, period=None):
+        """
+        Parameters
+        ----------
+        events : list of (int, dict)
+            Tick at which each message field change happens, sorted by tick. Changed fields keep
+            their value until the next change.
+        period : int, optional
+            Replay the script every period ticks. Played once if None.
+        """
+        self.events = events
+        self.period = period
+        self.message = dict(NEUTRAL_JOYSTICK_MESSAGE)
+        self.tick = 0
+        self.next_event = 0
+
+    def get(self):
+        if self.period is not None and self.tick == self.period:
+            self.tick = 0
+            self.next_event = 0
+        while self.next_event < len(self.events) and self.events[self.next_event][0] <= self.tick:
+            self.message.update(self.events[self.next_event][1])
+            self.next_event += 1
+        self.tick += 1
+        return self.message
+
+
+class NullPublisher:
+    """Replaces the UDPComms Publisher sending the controller color to the joystick"""
+
+    def send(self, obj):
+        pass
+
+
+class NullDisplay:
+    """Replaces the ST7789 display, remembering the last picture shown"""
+
+    def __init__(self):
+        self.picture = ""
+        self.picture_changes = 0
+
+    def show(self, picture):
+        if picture != self.picture:
+            self.picture = picture
+            self.picture_changes += 1
+
+
+class RecordingPWMWriter:
+    """Servo writer that records the duty cycles of every update instead of driving the servos"""
+
+    def __init__(self, pwm_params, capacity=4096):
+        """
+        Parameters
+        ----------
+        pwm_params : PWMParams
+            PWMParams object
+        capacity : int
+            Number of updates kept, older ones are overwritten.
+        """
+        self.pwm_params = pwm_params
+        self.duty_cycles = np.zeros((3, 4), dtype=np.int64)
+        self.frames = np.zeros((capacity, 3, 4), dtype=np.int64)
+        self.frame_count = 0
+        self.write_count = 0
+
+    def write(self, duty_cycle, axis_index, leg_index):
+        self.duty_cycles[axis_index, leg_index] = duty_cycle
+        self.write_count += 1
+        self.record()
+
+    def write_all(self, duty_cycles, mask=None):
+        if mask is None:
+            self.duty_cycles[:] = duty_cycles
+            self.write_count += 12
+        else:
+            np.copyto(self.duty_cycles, duty_cycles, where=mask)
+            self.write_count += int(np.count_nonzero(mask))
+        self.record()
+
+    def record(self):
+        self.frames[self.frame_count % len(self.frames)] = self.duty_cycles
+        self.frame_count += 1
+
+    def close(self):
+        pass
+
+
+class SimulatedClock:
+    """Clock for FixedRateScheduler where sleeping advances time instantly"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, duration):
+        self.now += duration
+
+
+class Simulation:
+    """The control loop of run_robot.py wired to in-memory fakes instead of the robot's hardware.
+
+    The joystick is scripted, servo commands are recorded and the display is dropped. Unless
+    realtime is set the loop runs on a SimulatedClock, as fast as the controller allows.
+    """
+
+    def __init__(self, config=None, joystick=None, realtime=False, telemetry=None, capacity=4096):
+        """
+        Parameters
+        ----------
+        config : Configuration, optional
+            Robot configuration, the default one if None.
+        joystick : ScriptedJoystick, optional
+            Source of joystick messages, default_script() replayed forever if None.
+        realtime : bool
+            Pace the loop at config.dt like the robot instead of running as fast as possible.
+        telemetry : Telemetry, optional
+            Stage timing of the loop, disabled if None.
+        capacity : int
+            Number of ticks of joint angles and servo commands kept.
+        """
+        self.config = Configuration() if config is None else config
+        if joystick is None:
+            (events, period) = default_script()
+            joystick = ScriptedJoystick(events, period)
+        self.joystick = joystick
+        self.telemetry = NullTelemetry() if telemetry is None else telemetry
+
+        if realtime:
+            self.clock = None
+            self.scheduler = FixedRateScheduler(self.config.dt, self.config.loop_spin_time)
+        else:
+            self.clock = SimulatedClock()
+            self.scheduler = FixedRateScheduler(self.config.dt, 0.0, self.clock.time, self.clock.sleep)
+
+        self.joystick_interface = JoystickInterface(
+            self.config, udp_handle=self.joystick, udp_publisher=NullPublisher()
+        )
+        self.pwm_writer = RecordingPWMWriter(PWMParams(), capacity)
+        self.hardware_interface = HardwareInterface(pwm_writer=self.pwm_writer)
+        self.display = NullDisplay()
+        self.movement_ctl = MovementScheme(MovementLib)
+        self.controller = Controller(self.config, load_inverse_kinematics(self.config), self.telemetry)
+        self.state = State()
+        self.state.quat_orientation = np.array([1, 0, 0, 0])
+        self.shutdown_requested = False
+        self.control_loop = ControlLoop(
+            self.config,
+            self.joystick_interface,
+            self.controller,
+            self.hardware_interface,
+            self.movement_ctl,
+            self.state,
+            self.display.show,
+            self.telemetry,
+            self.request_shutdown,
+        )
+
+        self.active = False
+        self.tick_count = 0
+        self.joint_angles = np.zeros((capacity, 3, 4))
+
+    def request_shutdown(self):
+        self.shutdown_requested = True
+
+    def step(self):
+        """Runs one tick of the control loop of run_robot.main"""
+        if self.active:
+            self.active = self.control_loop.tick()
+        else:
+            # Waiting for L1 to activate the robot
+            self.active = self.control_loop.wait_for_activation()
+
+    def run(self, ticks):
+        """Runs the control loop for a number of ticks, recording the joint angles of each"""
+        for _ in range(ticks):
+            self.scheduler.wait()
+            self.step()
+            self.joint_angles[self.tick_count % len(self.joint_angles)] = self.state.joint_angles
+            self.tick_count += 1
+
+    def recorded_joint_angles(self):
+        """Returns the joint angles of the ticks kept, oldest first, as a (ticks, 3, 4) array"""
+        count = min(self.tick_count, len(self.joint_angles))
+        indices = np.arange(self.tick_count - count, self.tick_count) % len(self.joint_angles)
+        return self.joint_angles[indices]
+
+    def close(self):
+        self.hardware_interface.close()
@@ -1,9 +1,11 @@
 import numpy as np
-from transforms3d.euler import euler2mat
+from src.Rotations import CachedRotation, yaw_matrix
 
 class StanceController:
     def __init__(self, config):
         self.config = config
+        self.delta_z = np.zeros(4)
+        self.yaw_rotation = CachedRotation()
 
 
     def position_delta(self, leg_index, state, command):
@@ -36,7 +38,7 @@ class StanceController:
             ]
         )
         delta_p = v_xy * self.config.dt
-        delta_R = euler2mat(0, 0, -command.yaw_rate * self.config.dt)
+        delta_R = yaw_matrix(-command.yaw_rate * self.config.dt)
         return (delta_p, delta_R)
 
     # TODO: put current foot location into state
@@ -46,3 +48,36 @@ class StanceController:
         incremented_location = delta_R @ foot_location + delta_p
 
         return incremented_location
+
+    def next_foot_locations(self, state, command, out=None):
+        """Calculate the next location of every foot as if all of them were in stance
+
+        The body motion over one timestep is the same for all feet, so the rotation is built
+        once and applied to all four feet with one matrix multiply.
+
+        Parameters
+        ----------
+        out : Numpy array (3, 4), optional
+            Preallocated array the foot locations are written into. A new array is allocated if None.
+
+        Returns
+        -------
+        Numpy array (3, 4)
+            Matrix of incremented foot locations.
+        """
+        if out is None:
+            out = np.empty((3, 4))
+        foot_locations = state.foot_locations
+        dt = self.config.dt
+        delta_R = self.yaw_rotation.update(0.0, 0.0, -command.yaw_rate * dt)
+        np.dot(delta_R, foot_locations, out=out)
+        out[0] += -command.horizontal_velocity[0] * dt
+        out[1] += -command.horizontal_velocity[1] * dt
+
+        # Move the feet towards the commanded height with a first order filter
+        delta_z = self.delta_z
+        np.subtract(state.height, foot_locations[2], out=delta_z)
+        delta_z *= 1.0 / self.config.z_time_constant
+        delta_z *= dt
+        out[2] += delta_z
+        return out
@@ -1,28 +1,41 @@
 import numpy as np
-from transforms3d.euler import euler2mat
+from src.Rotations import CachedRotation, yaw_matrix
 
 class SwingController:
-    def __init__(self, config):
+    def __init__(self, config, gait_controller):
         self.config = config
+        self.gait_controller = gait_controller
+
+        # Scratch buffers for next_foot_locations
+        self.touchdown_locations = np.zeros((2, 4))
+        self.delta_xy = np.zeros((2, 4))
+        self.time_left = np.zeros(4)
+        self.swing_heights = np.zeros((2, 4))
+        self.rising = np.zeros(4, dtype=bool)
+        self.touchdown_rotation = CachedRotation()
+        # Row views made once: a broadcasting ufunc or a new view would allocate every timestep
+        (self.touchdown_x, self.touchdown_y) = self.touchdown_locations
+        (self.delta_x, self.delta_y) = self.delta_xy
+        (self.rising_height, self.falling_height) = self.swing_heights
 
     def raibert_touchdown_location(
         self, leg_index, command
     ):
         delta_p_2d = (
             self.config.alpha
-            * self.config.stance_ticks
+            * self.gait_controller.stance_ticks
             * self.config.dt
             * command.horizontal_velocity
         )
         delta_p = np.array([delta_p_2d[0], delta_p_2d[1], 0])
         theta = (
             self.config.beta
-            * self.config.stance_ticks
+            * self.gait_controller.stance_ticks
             * self.config.dt
             * command.yaw_rate
         )
-        R = euler2mat(0, 0, theta)
-        return R @ self.config.default_stance[:, leg_index] + delta_p
+        R = yaw_matrix(theta)
+        return R @ self.config.compiled.default_stance[:, leg_index] + delta_p
 
 
     def swing_height(self, swing_phase, triangular=True):
@@ -45,8 +58,63 @@ class SwingController:
         foot_location = state.foot_locations[:, leg_index]
         swing_height_ = self.swing_height(swing_prop)
         touchdown_location = self.raibert_touchdown_location(leg_index, command)
-        time_left = self.config.dt * self.config.swing_ticks * (1.0 - swing_prop)
+        time_left = self.config.dt * self.gait_controller.swing_ticks * (1.0 - swing_prop)
         v = (touchdown_location - foot_location) / time_left * np.array([1, 1, 0])
         delta_foot_location = v * self.config.dt
         z_vector = np.array([0, 0, swing_height_ + command.height])
         return foot_location * np.array([1, 1, 0]) + z_vector + delta_foot_location
+
+    def next_foot_locations(self, swing_props, state, command, out=None):
+        """Calculate the next location of every foot as if all of them were swinging
+
+        Parameters
+        ----------
+        swing_props : numpy array (4)
+            Fraction of the swing completed by each foot.
+        out : Numpy array (3, 4), optional
+            Preallocated array the foot locations are written into. A new array is allocated if None.
+
+        Returns
+        -------
+        Numpy array (3, 4)
+            Matrix of new foot locations.
+        """
+        if out is None:
+            out = np.empty((3, 4))
+        foot_locations = state.foot_locations
+        dt = self.config.dt
+
+        # Raibert touchdown locations of all feet
+        touchdown_scale = self.config.alpha * self.gait_controller.stance_ticks * dt
+        theta = self.config.beta * self.gait_controller.stance_ticks * dt * command.yaw_rate
+        R = self.touchdown_rotation.update(0.0, 0.0, theta)
+        np.dot(R[:2], self.config.compiled.default_stance, out=self.touchdown_locations)
+        self.touchdown_x += touchdown_scale * command.horizontal_velocity[0]
+        self.touchdown_y += touchdown_scale * command.horizontal_velocity[1]
+
+        # Cover the remaining horizontal distance evenly over the rest of the swing, as
+        # dt / time_left per foot, applied row by row
+        time_left = self.time_left
+        np.subtract(1.0, swing_props, out=time_left)
+        time_left *= self.gait_controller.swing_ticks
+        np.reciprocal(time_left, out=time_left)
+        delta_xy = self.delta_xy
+        np.subtract(self.touchdown_locations, foot_locations[:2], out=delta_xy)
+        self.delta_x *= time_left
+        self.delta_y *= time_left
+        np.add(foot_locations[:2], delta_xy, out=out[:2])
+
+        # Triangular swing height profile, peaking at z_clearance halfway through the swing
+        z_clearance = self.config.z_clearance
+        rising_height = self.rising_height
+        falling_height = self.falling_height
+        np.divide(swing_props, 0.5, out=rising_height)
+        rising_height *= z_clearance
+        np.subtract(swing_props, 0.5, out=falling_height)
+        falling_height /= 0.5
+        np.subtract(1, falling_height, out=falling_height)
+        falling_height *= z_clearance
+        np.less(swing_props, 0.5, out=self.rising)
+        np.copyto(falling_height, rising_height, where=self.rising)
+        np.add(falling_height, command.height, out=out[2])
+        return out
@@ -0,0 +1,280 @@
+import json
+import os
+import signal
+import socket
+import threading
+import time
+
+import numpy as np
+
+# Stages of a control loop tick, in the order they run. "controller" is the part of
+# Controller.run outside gait and ik, all of it while the robot is deactivated.
+STAGES = ("joystick", "display", "movement", "gait", "ik", "controller", "servo")
+
+
+class LatencyHistogram:
+    """Log-linear histogram of integer latencies, in the style of HdrHistogram.
+
+    Values below 2**significant_bits have their own bucket, larger values are split into
+    2**significant_bits buckets per power of two, so every value is recorded with a
+    relative error below 2**-significant_bits at a fixed memory cost.
+    """
+
+    def __init__(self, significant_bits=5, max_bits=40):
+        """
+        Parameters
+        ----------
+        significant_bits : int
+            Number of bits of precision kept for each value.
+        max_bits : int
+            Values of 2**max_bits or more are recorded in the highest bucket.
+        """
+        self.significant_bits = significant_bits
+        self.sub_bucket_count = 1 << significant_bits
+        self.max_value = (1 << max_bits) - 1
+        self.counts = [0] * ((max_bits - significant_bits + 1) * self.sub_bucket_count)
+        self.total_count = 0
+        self.min = None
+        self.max = 0
+
+    def bucket_index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - 1 - self.significant_bits
+        return ((shift + 1) << self.significant_bits) + (value >> shift) - self.sub_bucket_count
+
+    def bucket_upper_value(self, index):
+        """Highest value recorded in the bucket"""
+        if index < self.sub_bucket_count:
+            return index
+        shift = (index >> self.significant_bits) - 1
+        sub_bucket = (index & (self.sub_bucket_count - 1)) + self.sub_bucket_count
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value):
+        value = min(max(int(value), 0), self.max_value)
+        self.counts[self.bucket_index(value)] += 1
+        self.total_count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Smallest bucket value that at least percent % of the recorded values do not exceed"""
+        if self.total_count == 0:
+            return 0
+        threshold = max(1, int(np.ceil(self.total_count * percent / 100.0)))
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= threshold:
+                return min(self.bucket_upper_value(index), self.max)
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.total_count = 0
+        self.min = None
+        self.max = 0
+
+
+class Telemetry:
+    """Per-stage timing of the control loop.
+
+    start_tick() starts a tick, mark(stage) charges the time since the previous mark to a
+    stage and end_tick() closes the tick. Stage durations in ns go into a fixed-size ring
+    buffer holding the latest ticks and into one LatencyHistogram per stage.
+    """
+
+    enabled = True
+
+    def __init__(self, stages=STAGES, capacity=4096):
+        """
+        Parameters
+        ----------
+        stages : tuple of str
+            Stage names. A "total" column holding the whole tick is added after them.
+        capacity : int
+            Number of ticks kept in the ring buffer.
+        """
+        self.stages = tuple(stages) + ("total",)
+        self.columns = {stage: column for column, stage in enumerate(self.stages)}
+        self.total_column = len(self.stages) - 1
+        self.ring = np.zeros((capacity, len(self.stages)), dtype=np.int64)
+        self.histograms = [LatencyHistogram() for _ in self.stages]
+        self.row = self.ring[0]
+        self.tick_count = 0
+        self.tick_start = 0
+        self.last_mark = 0
+
+    def start_tick(self):
+        self.row = self.ring[self.tick_count % len(self.ring)]
+        self.row[:] = 0
+        self.tick_start = self.last_mark = time.perf_counter_ns()
+
+    def mark(self, stage):
+        now = time.perf_counter_ns()
+        self.row[self.columns[stage]] += now - self.last_mark
+        self.last_mark = now
+
+    def end_tick(self):
+        self.row[self.total_column] = time.perf_counter_ns() - self.tick_start
+        for histogram, duration in zip(self.histograms, self.row.tolist()):
+            histogram.record(duration)
+        self.tick_count += 1
+
+    def latest(self, count=None):
+        """Returns the stage durations [ns] of the latest ticks, oldest first, as a (count, stages) array"""
+        stored = min(self.tick_count, len(self.ring))
+        count = stored if count is None else min(count, stored)
+        indices = np.arange(self.tick_count - count, self.tick_count) % len(self.ring)
+        return self.ring[indices]
+
+    def summary(self, percentiles=(50, 90, 99, 99.9)):
+        """Returns a dict of latency statistics [us] for each stage"""
+        summary = {"ticks": self.tick_count}
+        for stage, histogram in zip(self.stages, self.histograms):
+            stats = {"count": histogram.total_count, "max": histogram.max / 1e3}
+            for percent in percentiles:
+                stats["p" + str(percent)] = histogram.percentile(percent) / 1e3
+            summary[stage] = stats
+        return summary
+
+    def format_summary(self):
+        summary = self.summary()
+        lines = ["Control loop timing over " + str(summary["ticks"]) + " ticks [us]:"]
+        for stage in self.stages:
+            stats = summary[stage]
+            lines.append(
+                "{:>10}  p50 {:9.1f}  p90 {:9.1f}  p99 {:9.1f}  p99.9 {:9.1f}  max {:9.1f}".format(
+                    stage, stats["p50"], stats["p90"], stats["p99"], stats["p99.9"], stats["max"]
+                )
+            )
+        return "\n".join(lines)
+
+    def reset(self):
+        for histogram in self.histograms:
+            histogram.reset()
+        self.tick_count = 0
+
+    def dump(self, filename=None):
+        """Prints the summary and, if filename is given, saves the ring buffer contents as .npy"""
+        print(self.format_summary())
+        if filename:
+            np.save(filename, self.latest())
+            print("Saved the stage timings of the latest ticks to", filename)
+
+    def install_signal_handler(self, filename=None, signum=signal.SIGUSR1):
+        """Dumps the telemetry whenever the process receives signum, SIGUSR1 by default"""
+        signal.signal(signum, lambda signum, frame: self.dump(filename))
+
+
+class NullTelemetry:
+    """Telemetry stand-in used when it is disabled, every call returns immediately"""
+
+    enabled = False
+
+    def start_tick(self):
+        pass
+
+    def mark(self, stage):
+        pass
+
+    def end_tick(self):
+        pass
+
+
+class TelemetryServer(threading.Thread):
+    """Answers telemetry queries on a local datagram socket.
+
+    Requests are "summary", "latest <count>" or "reset", the replies are JSON. The address is
+    a (host, port) tuple for UDP or a filesystem path for a Unix datagram socket.
+    """
+
+    def __init__(self, telemetry, address, max_latest=500):
+        super().__init__(name="TelemetryServer", daemon=True)
+        self.telemetry = telemetry
+        self.max_latest = max_latest
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.unlink(address)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(address)
+        self.address = self.sock.getsockname()
+
+    def handle(self, request):
+        words = request.split()
+        if not words or words[0] == "summary":
+            return self.telemetry.summary()
+        if words[0] == "latest":
+            count = int(words[1]) if len(words) > 1 else 100
+            return {
+                "stages": self.telemetry.stages,
+                "ns": self.telemetry.latest(min(count, self.max_latest)).tolist(),
+            }
+        if words[0] == "reset":
+            self.telemetry.reset()
+            return {"reset": True}
+        return {"error": "unknown request " + repr(request)}
+
+    def run(self):
+        while True:
+            try:
+                request, sender = self.sock.recvfrom(1024)
+            except OSError:
+                return
+            try:
+                reply = self.handle(request.decode(errors="replace"))
+            except ValueError as error:
+                reply = {"error": str(error)}
+            if sender:
+                try:
+                    self.sock.sendto(json.dumps(reply).encode(), sender)
+                except OSError as error:
+                    print("Could not send telemetry reply:", error)
+
+    def close(self):
+        self.sock.close()
+
+
+def query(address, request="summary", timeout=1.0):
+    """Sends a request to a TelemetryServer and returns the decoded reply"""
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # Unix datagram sockets need a bound address to receive the reply
+        sock.bind(address + ".client." + str(os.getpid()))
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.settimeout(timeout)
+        sock.sendto(request.encode(), address)
+        return json.loads(sock.recv(65536).decode())
+    finally:
+        client_address = sock.getsockname()
+        sock.close()
+        if isinstance(address, str):
+            os.unlink(client_address)
+
+
+def make_telemetry(config):
+    """Creates the loop telemetry described by the configuration, NullTelemetry when disabled"""
+    if not config.telemetry_enabled:
+        return NullTelemetry()
+    telemetry = Telemetry(capacity=config.telemetry_capacity)
+    telemetry.install_signal_handler(config.telemetry_dump_file)
+    if config.telemetry_address is not None:
+        TelemetryServer(telemetry, config.telemetry_address).start()
+    return telemetry
+
+
+if __name__ == "__main__":
+    import sys
+
+    address = ("127.0.0.1", 8850)
+    if len(sys.argv) > 2:
+        address = sys.argv[2] if not sys.argv[2].isdigit() else ("127.0.0.1", int(sys.argv[2]))
+    reply = query(address, sys.argv[1] if len(sys.argv) > 1 else "summary")
+    print(json.dumps(reply, indent=2))
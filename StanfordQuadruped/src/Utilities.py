@@ -7,4 +7,5 @@ def deadband(value, band_radius):
 
 def clipped_first_order_filter(input, target, max_rate, tau):
     rate = (target - input) / tau
-    return np.clip(rate, -max_rate, max_rate)
+    # Plain min and max, np.clip on a scalar allocates arrays
+    return min(max(rate, -max_rate), max_rate)
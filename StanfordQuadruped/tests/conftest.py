@@ -0,0 +1,17 @@
+import os
+import sys
+
+# Same module layout as on the robot, with the repository in place of /home/ubuntu/Robotics/QuadrupedRobot
+tests_folder = os.path.dirname(os.path.abspath(__file__))
+package_folder = os.path.dirname(tests_folder)
+repository = os.path.dirname(package_folder)
+sys.path.insert(0, package_folder)
+sys.path.append(repository)
+sys.path.extend(
+    [
+        os.path.join(root, name)
+        for root, dirs, _ in os.walk(repository)
+        for name in dirs
+        if not name.startswith(".") and ".git" not in root
+    ]
+)
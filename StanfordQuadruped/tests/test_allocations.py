@@ -0,0 +1,111 @@
+"""The control tick runs on preallocated buffers: once warmed up it must not allocate arrays"""
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from pupper.Config import Configuration, PWMParams
+from pupper.HardwareInterface import HardwareInterface, angles_to_duty_cycles
+from pupper.Kinematics import four_legs_inverse_kinematics
+from pupper.KinematicsTable import KinematicsTable
+from src.Command import Command
+from src.Controller import Controller
+from src.Simulation import RecordingPWMWriter
+from src.State import BehaviorState, State
+
+
+@pytest.fixture
+def control_path(request):
+    config = Configuration()
+    controller = Controller(config, four_legs_inverse_kinematics)
+    state = State()
+    state.quat_orientation = np.array([1.0, 0.0, 0.0, 0.0])
+    state.behavior_state = getattr(request, "param", BehaviorState.TROT)
+    command = Command()
+    command.horizontal_velocity = np.array([0.1, 0.05])
+    command.yaw_rate = 0.2
+    hardware_interface = HardwareInterface(pwm_writer=RecordingPWMWriter(PWMParams()), output_thread=False)
+
+    def tick():
+        controller.run(state, command, None, None, None)
+        hardware_interface.set_actuator_postions(state.joint_angles)
+
+    # Warm up: fills the gait tables, the compiled configuration and the rotation caches
+    for _ in range(200):
+        tick()
+    yield config, state, hardware_interface, tick
+    hardware_interface.close()
+
+
+def call_peak(function, repeat=51):
+    """Memory allocated during a call and released again [bytes], the median over repeated calls.
+
+    The peak includes everything alive at once during the call, so a single temporary array
+    shows up even if it is freed before the call returns. The median ignores one-off
+    allocations such as a list growing on the first call.
+    """
+    peaks = []
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        function()
+        peaks.append(tracemalloc.get_traced_memory()[1] - start)
+    return sorted(peaks)[len(peaks) // 2]
+
+
+@pytest.mark.parametrize(
+    "control_path",
+    [BehaviorState.TROT, BehaviorState.REST, BehaviorState.HOP, BehaviorState.FINISHHOP, BehaviorState.DEACTIVATED],
+    indirect=True,
+)
+def test_control_tick_allocates_no_temporaries(control_path):
+    (_, _, _, tick) = control_path
+    joint_angles = np.empty((3, 4))
+    tracemalloc.start()
+    try:
+        # What a single temporary (3,4) array costs
+        temporary_peak = call_peak(lambda: joint_angles + 0.0)
+        tick_peak = call_peak(tick, repeat=201)
+    finally:
+        tracemalloc.stop()
+    assert tick_peak < temporary_peak
+
+
+def test_inverse_kinematics_and_duty_cycles_use_no_temporaries(control_path):
+    (config, state, hardware_interface, _) = control_path
+    joint_angles = np.empty((3, 4))
+    tracemalloc.start()
+    try:
+        # What a single temporary (3,4) array costs
+        temporary_peak = call_peak(lambda: joint_angles + 0.0)
+        ik_peak = call_peak(lambda: four_legs_inverse_kinematics(state.foot_locations, config, out=joint_angles))
+        duty_cycle_peak = call_peak(
+            lambda: angles_to_duty_cycles(
+                joint_angles,
+                hardware_interface.servo_params,
+                hardware_interface.duty_cycles,
+                hardware_interface.duty_cycles_work,
+                hardware_interface.nan_angles,
+            )
+        )
+    finally:
+        tracemalloc.stop()
+    assert ik_peak < temporary_peak
+    assert duty_cycle_peak < temporary_peak
+
+
+def test_ik_table_query_uses_no_temporaries(control_path):
+    (config, state, _, _) = control_path
+    config.ik_table_resolution = 0.005
+    config.ik_table_max_error = 0.05
+    ik_table = KinematicsTable.build(config)
+    joint_angles = np.empty((3, 4))
+    ik_table.inverse_kinematics(state.foot_locations, config, out=joint_angles)
+    tracemalloc.start()
+    try:
+        # What a single temporary (3,4) array costs
+        temporary_peak = call_peak(lambda: joint_angles + 0.0)
+        ik_peak = call_peak(lambda: ik_table.inverse_kinematics(state.foot_locations, config, out=joint_angles))
+    finally:
+        tracemalloc.stop()
+    assert ik_peak < temporary_peak
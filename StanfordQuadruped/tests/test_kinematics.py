@@ -0,0 +1,24 @@
+"""The stacked inverse kinematics solvers agree with the single leg solver"""
+import numpy as np
+
+from pupper.Config import Configuration
+from pupper.Kinematics import (
+    batch_inverse_kinematics,
+    four_legs_inverse_kinematics,
+    leg_explicit_inverse_kinematics,
+)
+
+
+def test_stacked_inverse_kinematics_matches_single_leg_solver():
+    config = Configuration()
+    rng = np.random.default_rng(0)
+    foot_positions = config.default_stance + np.array([0, 0, config.default_z_ref])[:, np.newaxis]
+    foot_positions = foot_positions + rng.uniform(-0.02, 0.02, (20, 3, 4))
+    joint_angles = batch_inverse_kinematics(foot_positions, config)
+    for r_body_foot, angles in zip(foot_positions, joint_angles):
+        np.testing.assert_allclose(angles, four_legs_inverse_kinematics(r_body_foot, config), atol=1e-12)
+        for leg_index in range(4):
+            expected = leg_explicit_inverse_kinematics(
+                r_body_foot[:, leg_index] - config.LEG_ORIGINS[:, leg_index], leg_index, config
+            )
+            np.testing.assert_allclose(angles[:, leg_index], expected, atol=1e-12)
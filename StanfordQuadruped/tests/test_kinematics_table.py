@@ -0,0 +1,60 @@
+"""The IK table must refuse or stop using joint angles computed for another geometry"""
+import numpy as np
+import pytest
+
+from pupper.Config import Configuration
+from pupper.Kinematics import four_legs_inverse_kinematics
+from pupper.KinematicsTable import KinematicsTable
+
+
+@pytest.fixture
+def table_file(tmp_path):
+    config = Configuration()
+    config.ik_table_resolution = 0.005
+    config.ik_table_max_error = 0.05
+    filename = str(tmp_path / "ik_table.npy")
+    KinematicsTable.build(config).save(filename)
+    return config, filename
+
+
+def test_load_matches_analytic_solver(table_file):
+    config, filename = table_file
+    ik_table = KinematicsTable.load(filename, config)
+    foot_positions = ik_table.random_foot_positions(8, np.random.default_rng(0))
+    for r_body_foot in foot_positions:
+        expected = four_legs_inverse_kinematics(r_body_foot, config)
+        np.testing.assert_allclose(ik_table.inverse_kinematics(r_body_foot, config), expected, atol=0.05)
+
+
+def test_load_rejects_other_geometry(table_file):
+    config, filename = table_file
+    config.LEG_L2 += 0.001
+    with pytest.raises(ValueError, match="different geometry"):
+        KinematicsTable.load(filename, config)
+
+
+def test_load_rejects_corrupted_table(table_file):
+    config, filename = table_file
+    table = np.load(filename)
+    table[:] = 0.0
+    np.save(filename, table)
+    with pytest.raises(ValueError, match="does not match"):
+        KinematicsTable.load(filename, config)
+
+
+def test_geometry_change_falls_back_to_analytic_solver(table_file):
+    config, filename = table_file
+    ik_table = KinematicsTable.load(filename, config)
+    r_body_foot = config.default_stance.copy()
+    r_body_foot[2] = -0.06
+
+    leg_l1 = config.LEG_L1
+    config.LEG_L1 = leg_l1 + 0.005
+    np.testing.assert_array_equal(
+        ik_table.inverse_kinematics(r_body_foot, config), four_legs_inverse_kinematics(r_body_foot, config)
+    )
+    assert ik_table.stale
+
+    config.LEG_L1 = leg_l1
+    ik_table.inverse_kinematics(r_body_foot, config)
+    assert not ik_table.stale
@@ -0,0 +1,106 @@
+"""PCA9685Writer sends every update as one auto-increment block of LEDn registers"""
+import numpy as np
+
+from pupper.Config import PWMParams
+from pupper.PCA9685 import (
+    CHANNEL_COUNT,
+    LED0_ON_L,
+    LED_FULL,
+    MODE1,
+    MODE1_AUTO_INCREMENT,
+    FakePCA9685Device,
+    PCA9685Writer,
+    duty_to_count,
+)
+
+PERIOD = 4000000  # ns at the default 250 Hz
+
+
+def make_writer(mode1=0):
+    device = FakePCA9685Device()
+    device.registers[MODE1] = mode1
+    return PCA9685Writer(PWMParams(), device), device
+
+
+def test_enables_auto_increment():
+    pca9685_writer, device = make_writer(mode1=0x01)
+    assert device.registers[MODE1] == 0x01 | MODE1_AUTO_INCREMENT
+    assert device.transactions == 2
+
+
+def test_keeps_auto_increment_without_writing_mode1():
+    pca9685_writer, device = make_writer(mode1=MODE1_AUTO_INCREMENT)
+    assert device.registers[MODE1] == MODE1_AUTO_INCREMENT
+    assert device.transactions == 1
+
+
+def test_duty_to_count_rounds_up():
+    assert duty_to_count(0, PERIOD) == 0
+    assert duty_to_count(1, PERIOD) == 1
+    assert duty_to_count(999999, PERIOD) == 1024
+    assert duty_to_count(1000000, PERIOD) == 1024
+    assert duty_to_count(1000001, PERIOD) == 1025
+    assert duty_to_count(PERIOD, PERIOD) == 4096
+
+
+def test_write_all_is_one_block_of_all_channels():
+    pca9685_writer, device = make_writer()
+    duty_cycles = np.random.default_rng(0).integers(500000, 2500000, size=(3, 4))
+    transactions = device.transactions
+    pca9685_writer.write_all(duty_cycles)
+    assert device.transactions == transactions + 1
+
+    counts = device.duty_counts()
+    for (axis_index, leg_index), channel in np.ndenumerate(pca9685_writer.channels):
+        assert counts[channel] == duty_to_count(duty_cycles[axis_index, leg_index], PERIOD)
+    # Channels 0 to 3 drive no servo and lie outside the block
+    unused = slice(LED0_ON_L, LED0_ON_L + 4 * pca9685_writer.first_channel)
+    assert not any(device.registers[unused])
+
+
+def test_block_layout_of_one_channel():
+    pca9685_writer, device = make_writer()
+    channel = pca9685_writer.channels[0, 0]
+    pca9685_writer.write(1000001, 0, 0)
+    # LEDn_ON_L, LEDn_ON_H, LEDn_OFF_L, LEDn_OFF_H, with 1025 = 0x401 counts on
+    first = LED0_ON_L + 4 * channel
+    assert bytes(device.registers[first : first + 4]) == bytes([0, 0, 0x01, 0x04])
+
+
+def test_full_on_and_full_off():
+    pca9685_writer, device = make_writer()
+    duty_cycles = np.full((3, 4), 1000000)
+    duty_cycles[0, 0] = 0
+    duty_cycles[1, 1] = PERIOD
+    pca9685_writer.write_all(duty_cycles)
+    counts = device.duty_counts()
+    assert counts[pca9685_writer.channels[0, 0]] == 0
+    assert counts[pca9685_writer.channels[1, 1]] == 4096
+    first = LED0_ON_L + 4 * pca9685_writer.channels[1, 1]
+    assert device.registers[first + 1] == LED_FULL
+
+
+def test_masked_write_sends_only_the_span_of_the_mask():
+    pca9685_writer, device = make_writer()
+    pca9685_writer.write_all(np.full((3, 4), 1000000))
+    mask = np.zeros((3, 4), dtype=bool)
+    mask[0, 1] = mask[0, 2] = True
+    device.registers[LED0_ON_L : LED0_ON_L + 4 * CHANNEL_COUNT] = bytes(4 * CHANNEL_COUNT)
+
+    transactions = device.transactions
+    pca9685_writer.write_all(np.full((3, 4), 2000000), mask)
+    assert device.transactions == transactions + 1
+    counts = device.duty_counts()
+    span = range(pca9685_writer.channels[mask].min(), pca9685_writer.channels[mask].max() + 1)
+    for channel in range(CHANNEL_COUNT):
+        if channel in pca9685_writer.channels[mask]:
+            assert counts[channel] == 2048
+        elif channel in span:
+            # Rewritten from the register image with the previous duty cycle
+            assert counts[channel] == 1024
+        else:
+            assert not any(device.registers[LED0_ON_L + 4 * channel : LED0_ON_L + 4 * channel + 4])
+
+    transactions = device.transactions
+    pca9685_writer.write_all(np.full((3, 4), 2000000), np.zeros((3, 4), dtype=bool))
+    assert device.transactions == transactions
@@ -0,0 +1,74 @@
+"""PWMWriter keeps one descriptor per servo and rewrites each duty_cycle node from offset 0"""
+import os
+
+import numpy as np
+import pytest
+
+from pupper.Config import PWMParams
+from pupper.HardwareInterface import PWMWriter
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    pwm_params = PWMParams()
+    for pin in np.ravel(pwm_params.pins):
+        node = tmp_path / ("pwm" + str(pin))
+        node.mkdir()
+        (node / "duty_cycle").write_text("")
+    return pwm_params, tmp_path
+
+
+def read_duty_cycle(root, pin):
+    return (root / ("pwm" + str(pin)) / "duty_cycle").read_text()
+
+
+def test_write_all_writes_every_node(sysfs):
+    pwm_params, root = sysfs
+    duty_cycles = np.arange(1000000, 1000012).reshape(3, 4)
+    with PWMWriter(pwm_params, str(root)) as pwm_writer:
+        pwm_writer.write_all(duty_cycles)
+    for (axis_index, leg_index), pin in np.ndenumerate(pwm_params.pins):
+        assert read_duty_cycle(root, pin) == "%d\n" % duty_cycles[axis_index, leg_index]
+
+
+def test_shorter_value_overwrites_from_offset_zero(sysfs):
+    pwm_params, root = sysfs
+    pin = pwm_params.pins[1, 2]
+    with PWMWriter(pwm_params, str(root)) as pwm_writer:
+        pwm_writer.write(1500000, 1, 2)
+        pwm_writer.write(900000, 1, 2)
+    # A regular file keeps the tail of the longer value, sysfs parses up to the newline
+    assert read_duty_cycle(root, pin).split("\n")[0] == "900000"
+
+
+def test_mask_writes_only_selected_servos(sysfs):
+    pwm_params, root = sysfs
+    mask = np.zeros((3, 4), dtype=bool)
+    mask[0, 1] = mask[2, 3] = True
+    with PWMWriter(pwm_params, str(root)) as pwm_writer:
+        pwm_writer.write_all(np.full((3, 4), 1200000), mask)
+    for (axis_index, leg_index), pin in np.ndenumerate(pwm_params.pins):
+        expected = "1200000\n" if mask[axis_index, leg_index] else ""
+        assert read_duty_cycle(root, pin) == expected
+
+
+def test_descriptors_stay_open_until_close(sysfs):
+    pwm_params, root = sysfs
+    pwm_writer = PWMWriter(pwm_params, str(root))
+    fds = [fd for row in pwm_writer.fds for fd in row]
+    for _ in range(3):
+        pwm_writer.write_all(np.full((3, 4), 1000000))
+    assert [fd for row in pwm_writer.fds for fd in row] == fds
+    pwm_writer.close()
+    assert all(fd is None for row in pwm_writer.fds for fd in row)
+    with pytest.raises(OSError):
+        os.fstat(fds[0])
+
+
+def test_missing_node_closes_opened_descriptors(sysfs):
+    pwm_params, root = sysfs
+    os.remove(root / ("pwm" + str(pwm_params.pins[2, 3])) / "duty_cycle")
+    fd_count = len(os.listdir("/proc/self/fd"))
+    with pytest.raises(OSError):
+        PWMWriter(pwm_params, str(root))
+    assert len(os.listdir("/proc/self/fd")) == fd_count
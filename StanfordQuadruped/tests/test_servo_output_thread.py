@@ -0,0 +1,47 @@
+"""A failing servo write must reach the control loop instead of ending the output thread"""
+import time
+
+import numpy as np
+import pytest
+
+from pupper.HardwareInterface import ServoOutputThread
+
+
+def test_write_error_is_raised_from_next_put():
+    written = []
+    failures = [OSError("Remote I/O error")]
+
+    def write_function(joint_angles):
+        if failures:
+            raise failures.pop()
+        written.append(joint_angles.copy())
+
+    output_thread = ServoOutputThread(write_function, wait_timeout=0.01)
+    output_thread.start()
+    try:
+        output_thread.put(np.zeros((3, 4)))
+        deadline = time.monotonic() + 1.0
+        while output_thread.write_error is None and time.monotonic() < deadline:
+            time.sleep(0.001)
+        assert output_thread.write_errors == 1
+
+        with pytest.raises(OSError, match="Remote I/O error"):
+            output_thread.put(np.ones((3, 4)))
+
+        # The error is raised once and the thread keeps writing
+        output_thread.put(np.ones((3, 4)))
+        deadline = time.monotonic() + 1.0
+        while not written and time.monotonic() < deadline:
+            time.sleep(0.001)
+    finally:
+        output_thread.stop()
+    assert output_thread.written_frames == 1
+    np.testing.assert_array_equal(written[0], np.ones((3, 4)))
+
+
+def test_put_raises_once_thread_stopped():
+    output_thread = ServoOutputThread(lambda joint_angles: None, wait_timeout=0.01)
+    output_thread.start()
+    output_thread.stop()
+    with pytest.raises(RuntimeError, match="not running"):
+        output_thread.put(np.zeros((3, 4)))
@@ -0,0 +1,27 @@
+"""The headless simulation runs the same control loop as run_robot.py"""
+import numpy as np
+
+from src.ControlLoop import ControlLoop
+from src.Simulation import Simulation, default_script
+from src.State import BehaviorState
+
+
+def test_run_robot_imports_without_hardware():
+    import run_robot
+
+    assert callable(run_robot.main)
+
+
+def test_default_script_exercises_every_behavior_state():
+    simulation = Simulation()
+    assert isinstance(simulation.control_loop, ControlLoop)
+    (_, period) = default_script()
+    seen = set()
+    for _ in range(period):
+        simulation.run(1)
+        seen.add(simulation.state.behavior_state)
+    simulation.close()
+    assert {BehaviorState.TROT, BehaviorState.REST, BehaviorState.HOP, BehaviorState.FINISHHOP} <= seen
+    assert simulation.pwm_writer.frame_count > 0
+    assert not simulation.active
+    assert np.isfinite(simulation.recorded_joint_angles()).all()
@@ -0,0 +1,78 @@
+"""UDPComms topics must survive publisher restarts and attach to the running event loop"""
+import asyncio
+import os
+
+import pytest
+
+from UDPComms import LocalPublisher, LocalSubscriber, MessageStats, Subscriber
+from UDPComms.UDPComms import LOCAL_CLOSED, SEQUENCE_MODULUS
+
+
+def test_local_publisher_reuses_slot_left_closed():
+    port = 20000 + os.getpid() % 10000
+    with LocalPublisher(port) as publisher:
+        publisher.send({"value": 1})
+        # What a publisher leaves behind if it is killed between marking and removing the slot
+        publisher.words[0] = LOCAL_CLOSED
+        with LocalPublisher(port) as restarted_publisher:
+            assert restarted_publisher.sequence == 0
+            subscriber = LocalSubscriber(port)
+            try:
+                restarted_publisher.send({"value": 2})
+                assert subscriber.recv() == {"value": 2}
+                assert subscriber.stats.received == 1
+            finally:
+                subscriber.close()
+            publisher.close()
+
+
+def test_restart_detected_when_first_message_lost():
+    stats = MessageStats()
+    for sequence in range(10):
+        assert stats.update(sequence, send_time=sequence, arrival_time=sequence + 0.001)
+    # The restarted publisher's message 0 was lost
+    for sequence in range(1, 4):
+        send_time = 10 + sequence
+        assert stats.update(sequence, send_time, send_time + 0.001)
+    assert stats.reordered == 0
+    assert stats.highest_sequence == 3
+
+
+def test_restart_detected_from_large_backwards_jump():
+    stats = MessageStats()
+    stats.update(1000, send_time=5.0, arrival_time=5.001)
+    # The publisher's host rebooted, so its clock went back too
+    assert stats.update(1, send_time=1.0, arrival_time=6.0)
+    assert stats.reordered == 0
+    assert stats.highest_sequence == 1
+
+
+def test_late_message_is_reordered():
+    stats = MessageStats()
+    stats.update(0, send_time=0.0, arrival_time=0.001)
+    stats.update(2, send_time=2.0, arrival_time=2.001)
+    assert stats.lost == 1
+    assert not stats.update(1, send_time=1.0, arrival_time=2.002)
+    assert (stats.reordered, stats.lost, stats.highest_sequence) == (1, 0, 2)
+
+
+def test_sequence_wraps_around():
+    stats = MessageStats()
+    stats.update(SEQUENCE_MODULUS - 1, send_time=0.0, arrival_time=0.001)
+    assert stats.update(1, send_time=2.0, arrival_time=2.001)
+    assert stats.lost == 1
+
+
+def test_attach_uses_running_loop():
+    subscriber = Subscriber(0)
+
+    async def attach():
+        subscriber.attach()
+        try:
+            return subscriber.loop is asyncio.get_running_loop()
+        finally:
+            subscriber.detach()
+
+    assert asyncio.run(attach())
+    with pytest.raises(RuntimeError):
+        subscriber.attach()
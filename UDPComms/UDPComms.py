@@ -1,184 +1,925 @@
 
 import socket
 import struct
-from collections import namedtuple
+from collections import deque, namedtuple
 from time import monotonic
 import msgpack
+import os
+import select
+import selectors
+import threading
 import time
+import zlib
 
 timeout = socket.timeout
 
 MAX_SIZE = 65507
 
+# First byte of binary messages. 0xC1 is never used by msgpack, so binary and msgpack
+# datagrams can share a port and the subscriber tells them apart by this byte.
+BINARY_MAGIC = 0xC1
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<BBB")
+
+# Schema id 0 marks the envelope a sequenced Publisher puts in front of each message:
+# header, sequence number and the sender's time.monotonic() at sending
+ENVELOPE_ID = 0
+ENVELOPE = struct.Struct("<BBBId")
+
+# Schema id 255 marks a batch: header and message count, then each message after its length
+BATCH_ID = 255
+BATCH_HEADER = struct.Struct("<BBBH")
+BATCH_LENGTH = struct.Struct("<H")
+
+SCHEMAS = {}
+
+
+class StructMessage(dict):
+    """ A decoded binary message, a dict of the schema's keys that is refilled by each decode """
+    __slots__ = ("schema", "values")
+
+    def __init__(self, schema=None):
+        super().__init__()
+        self.schema = schema
+        self.values = None
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def to_dict(self):
+        return dict(self)
+
+    def __repr__(self):
+        return "StructMessage(" + str(self.schema.name if self.schema else None) + ", " + dict.__repr__(self) + ")"
+
+
+class Schema:
+    """ Fixed binary layout of a message type: a header, struct packed fields and a button bitfield """
+
+    def __init__(self, schema_id, name, fields, buttons=()):
+        """ Create a Schema Object
+
+        Arguments:
+            schema_id    -- number from 0 to 255 identifying the schema in the message header
+            name         -- name of the message type
+            fields       -- list of (key, struct format character) pairs
+            buttons      -- keys of the 0/1 values packed into a 32 bit field after the other fields
+        """
+        self.schema_id = schema_id
+        self.name = name
+        self.fields = [key for key, _ in fields]
+        self.buttons = list(buttons)
+        self.header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, schema_id)
+        self.body = struct.Struct("<" + "".join(code for _, code in fields) + ("I" if self.buttons else ""))
+        self.size = BINARY_HEADER.size + self.body.size
+        self.buffer = bytearray(self.size)
+        self.buffer[:BINARY_HEADER.size] = self.header
+
+        self.button_masks = [(key, 1 << bit) for bit, key in enumerate(self.buttons)]
+
+    def pack(self, message):
+        """ Encode a dict (or StructMessage) with all of the schema's keys, returns a memoryview of a reused buffer """
+        values = [message[key] for key in self.fields]
+        if self.buttons:
+            bits = 0
+            for key, mask in self.button_masks:
+                if message[key]:
+                    bits |= mask
+            values.append(bits)
+        self.body.pack_into(self.buffer, BINARY_HEADER.size, *values)
+        return memoryview(self.buffer)
+
+    def unpack_into(self, data, message):
+        """ Decode a binary message into an existing StructMessage """
+        values = self.body.unpack_from(data, BINARY_HEADER.size)
+        if message.schema is not self:
+            message.clear()
+            message.schema = self
+        elif values == message.values:
+            # Same contents as the message already holds, e.g. a joystick at rest
+            return message
+        message.values = values
+        message.update(zip(self.fields, values))
+        if self.buttons:
+            bits = values[-1]
+            for key, mask in self.button_masks:
+                message[key] = 1 if bits & mask else 0
+        return message
+
+
+def register_schema(schema):
+    if schema.schema_id == ENVELOPE_ID:
+        raise ValueError("Schema id " + str(ENVELOPE_ID) + " is reserved for the sequence envelope")
+    if schema.schema_id == BATCH_ID:
+        raise ValueError("Schema id " + str(BATCH_ID) + " is reserved for batches")
+    if schema.schema_id in SCHEMAS:
+        raise ValueError("Schema id " + str(schema.schema_id) + " is already used by " + SCHEMAS[schema.schema_id].name)
+    SCHEMAS[schema.schema_id] = schema
+    return schema
+
+
+def decode_binary(data, message=None):
+    """ Decode a datagram starting with BINARY_MAGIC. Reuses message if it is given """
+    if len(data) < BINARY_HEADER.size:
+        raise ValueError("Binary message too short")
+    if data[1] != BINARY_VERSION:
+        raise ValueError("Unsupported binary message version " + str(data[1]))
+    schema = SCHEMAS.get(data[2])
+    if schema is None:
+        raise ValueError("Unknown binary message schema " + str(data[2]))
+    if len(data) != schema.size:
+        raise ValueError("Binary " + schema.name + " message has " + str(len(data)) + " bytes, expected " + str(schema.size))
+    if message is None:
+        message = StructMessage(schema)
+    return schema.unpack_into(data, message)
+
+
+def split_batch(data):
+    """ Returns memoryviews of the messages in a batch datagram """
+    data = memoryview(data)
+    if data[1] != BINARY_VERSION:
+        raise ValueError("Unsupported binary message version " + str(data[1]))
+    _, _, _, count = BATCH_HEADER.unpack_from(data)
+    messages = []
+    offset = BATCH_HEADER.size
+    for _ in range(count):
+        (length,) = BATCH_LENGTH.unpack_from(data, offset)
+        offset += BATCH_LENGTH.size
+        if offset + length > len(data):
+            raise ValueError("Truncated batch")
+        messages.append(data[offset:offset + length])
+        offset += length
+    return messages
+
+
+# Message of PupperCommand/joystick.py
+JOYSTICK_SCHEMA = register_schema(Schema(
+    1,
+    "joystick",
+    [("lx", "f"), ("ly", "f"), ("rx", "f"), ("ry", "f"), ("L2", "f"), ("R2", "f"),
+     ("dpadx", "b"), ("dpady", "b"), ("message_rate", "B")],
+    ["L1", "R1", "x", "square", "circle", "triangle"],
+))
+
+# Publishers number their messages modulo this
+SEQUENCE_MODULUS = 2 ** 32
+# A message further behind the newest one than this is from a restarted publisher
+REORDER_WINDOW = 256
+
+
+class MessageStats:
+    """ Delivery statistics of a sequenced message stream, kept by its Subscriber
+
+    Send times come from the publisher's time.monotonic(), so latency and message
+    age are only meaningful when publisher and subscriber run on the same host.
+
+    A message behind the newest one is a late arrival if it was also sent before it. If it
+    was sent later, or is more than REORDER_WINDOW messages behind, the publisher restarted
+    and the stream is rebased on it, even if the restarted publisher's first messages were lost. """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.received = 0
+        self.lost = 0
+        self.reordered = 0
+        self.highest_sequence = None
+        self.last_send_time = float('-inf')
+        self.last_arrival_time = float('-inf')
+        self.last_transit = None
+        self.latency = 0.0
+        self.max_latency = 0.0
+        # Smoothed inter-arrival jitter as in RFC 3550
+        self.jitter = 0.0
+
+    def update(self, sequence, send_time, arrival_time):
+        """ Account for a received message. Returns True if it is the newest message so far """
+        self.received += 1
+        transit = arrival_time - send_time
+        if self.last_transit is not None:
+            self.jitter += (abs(transit - self.last_transit) - self.jitter) / 16.0
+        self.last_transit = transit
+        self.latency = transit
+        self.max_latency = max(self.max_latency, transit)
+
+        if self.highest_sequence is not None:
+            # Distances modulo SEQUENCE_MODULUS, so wrapping around is not a jump
+            ahead = (sequence - self.highest_sequence) % SEQUENCE_MODULUS
+            behind = (self.highest_sequence - sequence) % SEQUENCE_MODULUS
+            if 0 < ahead < SEQUENCE_MODULUS // 2:
+                self.lost += ahead - 1
+            elif behind <= REORDER_WINDOW and send_time <= self.last_send_time:
+                # Arrived after a newer message, it was counted as lost then
+                self.reordered += 1
+                self.lost = max(self.lost - 1, 0)
+                return False
+        # First message, newer message, or the publisher restarted
+        self.highest_sequence = sequence
+        self.last_send_time = send_time
+        self.last_arrival_time = arrival_time
+        return True
+
+    @property
+    def loss_rate(self):
+        expected = self.received + self.lost
+        return self.lost / expected if expected else 0.0
+
+    def message_age(self, now=None):
+        """ Seconds since the newest message was sent """
+        return (monotonic() if now is None else now) - self.last_send_time
+
+    def arrival_age(self, now=None):
+        """ Seconds since the newest message arrived """
+        return (monotonic() if now is None else now) - self.last_arrival_time
+
+    def as_dict(self):
+        return {
+            "received": self.received,
+            "lost": self.lost,
+            "loss_rate": self.loss_rate,
+            "reordered": self.reordered,
+            "latency": self.latency,
+            "max_latency": self.max_latency,
+            "jitter": self.jitter,
+            "message_age": self.message_age(),
+        }
+
+
 class Publisher:
-    def __init__(self, port_tx,port):
+    def __init__(self, port_tx,port, schema=None, sequence=False, batch_size=1, batch_interval=None,
+                 destinations=()):
         """ Create a Publisher Object
 
         Arguments:
             port         -- the port to publish the messages on
+            schema       -- send messages in this Schema's binary layout instead of msgpack
+            sequence     -- prefix each message with a sequence number and send time,
+                            which Subscribers use for their MessageStats
+            batch_size   -- send messages in batches of this many, one datagram each
+            batch_interval -- also send the batch once its first message is this many seconds old,
+                            see flush_due()
+            destinations -- more ports, or (host, port) tuples, each datagram is sent to
         """
+        self.schema = schema
+        self.sequenced = sequence
+        self.sequence = 0
+        self.envelope = bytearray(ENVELOPE.size)
+        # Largest message or batch that still fits in a datagram with the envelope, if any
+        self.max_size = MAX_SIZE - ENVELOPE.size if sequence else MAX_SIZE
+
+        # Messages waiting to be sent as one batch datagram, see flush()
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.batching = batch_size > 1 or batch_interval is not None
+        self.batch = bytearray(self.max_size if self.batching else 0)
+        self.batch_view = memoryview(self.batch)
+        self.batch_count = 0
+        self.batch_end = BATCH_HEADER.size
+        self.batch_deadline = None
+        # Held while the batch changes, a Poller may flush it from its own thread
+        self.batch_lock = threading.Lock()
+        self.poller = None
+
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.des_address = ("127.0.0.1",port_tx)
+        self.des_addresses = [self.des_address] + \
+            [("127.0.0.1", address) if isinstance(address, int) else address for address in destinations]
         self.sock.bind(("127.0.0.1", port))
         self.sock.settimeout(0.2)
 
     def send(self, obj):
-        """ Publish a message. The obj can be any nesting of standard python types """
-        msg = msgpack.dumps(obj, use_bin_type=False)
-        assert len(msg) < MAX_SIZE, "Encoded message too big!"
-        self.sock.sendto(msg,self.des_address)
+        """ Publish a message. The obj can be any nesting of standard python types,
+            or a dict with the schema's keys if the Publisher has a schema """
+        if self.schema is not None:
+            msg = self.schema.pack(obj)
+        else:
+            msg = msgpack.dumps(obj, use_bin_type=False)
+        size = len(msg)
+
+        if not self.batching:
+            assert size < self.max_size, "Encoded message too big!"
+            self._send_datagram(msg)
+            return
+
+        assert BATCH_HEADER.size + BATCH_LENGTH.size + size <= len(self.batch), "Encoded message too big!"
+        with self.batch_lock:
+            if self.batch_end + BATCH_LENGTH.size + size > len(self.batch):
+                self._flush()
+            new_batch = self.batch_count == 0
+            if new_batch and self.batch_interval is not None:
+                self.batch_deadline = monotonic() + self.batch_interval
+            BATCH_LENGTH.pack_into(self.batch, self.batch_end, size)
+            self.batch_end += BATCH_LENGTH.size
+            self.batch_view[self.batch_end:self.batch_end + size] = msg
+            self.batch_end += size
+            self.batch_count += 1
+
+            if self.batch_count >= self.batch_size or \
+                    (self.batch_deadline is not None and monotonic() >= self.batch_deadline):
+                self._flush()
+                return
+        if new_batch and self.batch_deadline is not None and self.poller is not None:
+            # The poller may be sleeping without a deadline
+            self.poller.wakeup()
+
+    def flush(self):
+        """ Send the messages waiting in the batch now """
+        with self.batch_lock:
+            self._flush()
+
+    def flush_due(self, now=None):
+        """ Send the batch if its batch_interval has passed. Call it regularly, e.g. from the control
+            loop, or register the publisher with a Poller, which calls it at the deadline.
+
+            Returns the seconds left until the waiting batch is due, or None if there is none """
+        if self.batch_deadline is None:
+            return None
+        now = monotonic() if now is None else now
+        with self.batch_lock:
+            if self.batch_deadline is None:
+                return None
+            if now < self.batch_deadline:
+                return self.batch_deadline - now
+            self._flush()
+        return None
+
+    def _flush(self):
+        if self.batch_count == 0:
+            return
+        BATCH_HEADER.pack_into(self.batch, 0, BINARY_MAGIC, BINARY_VERSION, BATCH_ID, self.batch_count)
+        self._send_datagram(self.batch_view[:self.batch_end])
+        self.batch_count = 0
+        self.batch_end = BATCH_HEADER.size
+        self.batch_deadline = None
+
+    def _send_datagram(self, msg):
+        # One encoding, sent to each destination in turn
+        if not self.sequenced:
+            for address in self.des_addresses:
+                self.sock.sendto(msg, address)
+            return
+        ENVELOPE.pack_into(self.envelope, 0, BINARY_MAGIC, BINARY_VERSION, ENVELOPE_ID, self.sequence, monotonic())
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        buffers = [self.envelope, msg]
+        for address in self.des_addresses:
+            self.sock.sendmsg(buffers, [], 0, address)
 
     def __del__(self):
+        if not hasattr(self, "sock"):
+            return
+        try:
+            self.flush()
+        except OSError:
+            pass
         self.sock.close()
 
 
 class Subscriber:
-    def __init__(self, port_rx, timeout=0.2):
+    def __init__(self, port, timeout=0.2, unpacker=False):
         """ Create a Subscriber Object
 
         Arguments:
             port         -- the port to listen to messages on
             timeout      -- how long to wait before a message is considered out of date
+            unpacker     -- decode through a streaming msgpack.Unpacker instead of msgpack.loads
         """
         self.max_size = MAX_SIZE
+
+        self.port = port
         self.timeout = timeout
 
-        self.last_data = None
+        # Datagrams are received into a spare preallocated buffer, which is swapped with
+        # the current one when the datagram is the newest message
+        self.buffer = bytearray(self.max_size)
+        self.view = memoryview(self.buffer)
+        self.spare = bytearray(self.max_size)
+        self.spare_view = memoryview(self.spare)
+        self.last_offset = 0
+        self.last_size = 0
         self.last_time = float('-inf')
 
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) 
-        self.sock.settimeout(timeout)
-        self.sock.bind(("127.0.0.1", port_rx))
+        # Messages of a batch datagram not yet returned by recv
+        self.pending = deque()
+
+        # Only updated by messages from a sequenced Publisher
+        self.stats = MessageStats()
+
+        # Binary messages decoded by get are written into this object instead of a new one
+        self.binary_message = StructMessage(None)
+
+        # Event-driven mode, see attach() and Poller: datagrams are received when the kernel
+        # reports them and the latest message is decoded ahead of get()
+        self.event_driven = False
+        self.latest = None
+        self.callbacks = []
+        self.loop = None
+        self.waiters = []
+
+        self.unpacker = None
+        if unpacker:
+            self.unpacker = msgpack.Unpacker(raw=False, max_buffer_size=self.max_size)
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # UDP
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        # Always non-blocking, recv waits with select so get never changes the socket mode
+        self.sock.setblocking(False)
+        self.sock.bind(("", port))
+
+    @property
+    def last_data(self):
+        """ The latest datagram received, as bytes """
+        return bytes(self.view[self.last_offset:self.last_size])
+
+    def _receive(self):
+        """ Receive one datagram without blocking.
+
+        Returns the message part of the datagram, or None if there was none. Sequenced
+        messages older than the newest one received are returned but not kept by get """
+        try:
+            size = self.sock.recv_into(self.spare)
+        except (BlockingIOError, InterruptedError):
+            return None
+        now = monotonic()
+        data = self.spare_view[:size]
+        offset = 0
+        if size >= ENVELOPE.size and data[0] == BINARY_MAGIC and data[2] == ENVELOPE_ID:
+            _, _, _, sequence, send_time = ENVELOPE.unpack_from(data)
+            offset = ENVELOPE.size
+            if not self.stats.update(sequence, send_time, now):
+                return data[offset:]
+
+        self.buffer, self.spare = self.spare, self.buffer
+        self.view, self.spare_view = self.spare_view, self.view
+        self.last_offset = offset
+        self.last_size = size
+        self.last_time = now
+        return self.view[offset:size]
+
+    def _decode(self, data, message=None):
+        """ Decode a message. Of a batch, only its last message is decoded """
+        if data and data[0] == BINARY_MAGIC:
+            if data[2] == BATCH_ID:
+                return self._decode(split_batch(data)[-1], message)
+            return decode_binary(data, message)
+        if self.unpacker is None:
+            return msgpack.loads(data, raw=False)
+        # Consume the whole datagram so nothing carries over into the next one
+        self.unpacker.feed(data)
+        message = None
+        for message in self.unpacker:
+            pass
+        return message
+
+    def _decode_all(self, data):
+        """ Decode all messages of a datagram, in the order they were sent """
+        if data and data[0] == BINARY_MAGIC and data[2] == BATCH_ID:
+            return [self._decode(message) for message in split_batch(data)]
+        return [self._decode(data)]
 
     def recv(self):
         """ Receive a single message from the socket buffer. It blocks for up to timeout seconds.
         If no message is received before timeout it raises a UDPComms.timeout exception"""
 
-        try:
-            self.last_data, address = self.sock.recvfrom(3)
-        except BlockingIOError:
-            raise socket.timeout("no messages in buffer and called with timeout = 0")
-        print(self.last_data)
-        self.last_time = monotonic()
-        return msgpack.loads(self.last_data, raw=False)
+        if self.pending:
+            return self.pending.popleft()
+        data = self._receive()
+        if data is None:
+            if self.timeout:
+                select.select([self.sock], [], [], self.timeout)
+            data = self._receive()
+            if data is None:
+                raise socket.timeout("no message received within timeout=" + str(self.timeout))
+        messages = self._decode_all(data)
+        self.pending.extend(messages[1:])
+        return messages[0]
+
     def get(self):
         """ Returns the latest message it can without blocking. If the latest massage is 
-            older then timeout seconds it raises a UDPComms.timeout exception"""
-        try:
-            self.sock.settimeout(0)
-            while True:
-                self.last_data, address = self.sock.recvfrom(self.max_size)
-                self.last_time = monotonic()
-        except socket.error:
-            pass
-        finally:
-            self.sock.settimeout(self.timeout)
+            older then timeout seconds it raises a UDPComms.timeout exception
+
+            Binary messages are decoded into the same StructMessage on every call,
+            unless the subscriber is event-driven, then get() makes no system calls"""
+        if not self.event_driven:
+            while self._receive() is not None:
+                pass
+        # Older than the latest message
+        self.pending.clear()
 
         current_time = monotonic()
         if (current_time - self.last_time) < self.timeout:
-            return msgpack.loads(self.last_data, raw=False)
+            if self.event_driven:
+                return self.latest
+            return self._decode(self.view[self.last_offset:self.last_size], self.binary_message)
         else:
             raise socket.timeout("timeout=" + str(self.timeout) + \
                                  ", last message time=" + str(self.last_time) + \
                                  ", current time=" + str(current_time))
 
     def get_list(self):
-        """ Returns list of messages, in the order they were received"""
-        msg_bufer = []
-        try:
-            self.sock.settimeout(0)
-            while True:
-                self.last_data, address = self.sock.recvfrom(self.max_size)
-                self.last_time = monotonic()
-                msg = msgpack.loads(self.last_data, raw=False)
-                msg_bufer.append(msg)
-        except socket.error:
+        """ Returns list of messages, in the order they were received. Batches are split into their messages"""
+        if self.event_driven:
+            raise RuntimeError("get_list is not available on an event-driven Subscriber, use a callback")
+        msg_bufer = list(self.pending)
+        self.pending.clear()
+        data = self._receive()
+        while data is not None:
+            msg_bufer.extend(self._decode_all(data))
+            data = self._receive()
+        return msg_bufer
+
+    def on_readable(self):
+        """ Receives all queued datagrams and decodes the newest message. Called by the event loop or Poller """
+        last_time = self.last_time
+        while self._receive() is not None:
             pass
-        finally:
-            self.sock.settimeout(self.timeout)
+        if self.last_time == last_time:
+            return
+        # A new object each time, get() may be handing out the previous one on another thread
+        message = self._decode(self.view[self.last_offset:self.last_size])
+        self.latest = message
+        for callback in self.callbacks:
+            callback(message)
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(message)
+
+    def attach(self, loop=None):
+        """ Makes the subscriber event-driven on an asyncio event loop, see next_message()
 
-        return msg_bufer
+        Arguments:
+            loop         -- the event loop, defaults to the running one. Without a running
+                            loop, as outside a coroutine, it must be given
+        """
+        import asyncio
+        self.loop = asyncio.get_running_loop() if loop is None else loop
+        self.event_driven = True
+        self.loop.add_reader(self.sock.fileno(), self.on_readable)
+
+    def detach(self):
+        if self.loop is not None:
+            self.loop.remove_reader(self.sock.fileno())
+            self.loop = None
+        self.event_driven = False
+
+    async def next_message(self):
+        """ Waits for the next message on an attached subscriber """
+        waiter = self.loop.create_future()
+        self.waiters.append(waiter)
+        return await waiter
 
     def __del__(self):
         self.sock.close()
 
-class Subscriber:
-    def __init__(self, port, timeout=0.2):
-        """ Create a Subscriber Object
+
+class Poller:
+    """ Serves several Subscribers from one thread, receiving only when the kernel reports a datagram
+
+    Registered subscribers are event-driven: their get() returns the latest message received
+    by the poller without any system calls. """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.wakeup_receiver.setblocking(False)
+        self.selector.register(self.wakeup_receiver, selectors.EVENT_READ, None)
+        self.running = False
+        self.thread = None
+        self.publishers = []
+
+    def register(self, subscriber, callback=None):
+        """ Serve subscriber from this poller. callback, if given, is called with every new latest message """
+        subscriber.event_driven = True
+        if callback is not None:
+            subscriber.callbacks.append(callback)
+        self.selector.register(subscriber.sock, selectors.EVENT_READ, subscriber)
+        # Pick up anything that arrived before
+        subscriber.on_readable()
+
+    def unregister(self, subscriber):
+        self.selector.unregister(subscriber.sock)
+        subscriber.event_driven = False
+
+    def register_publisher(self, publisher):
+        """ Send the batches of a Publisher with a batch_interval when they are due """
+        publisher.poller = self
+        self.publishers.append(publisher)
+        self.wakeup()
+
+    def unregister_publisher(self, publisher):
+        self.publishers.remove(publisher)
+        publisher.poller = None
+
+    def wakeup(self):
+        """ Makes a poll() waiting in another thread return """
+        self.wakeup_sender.send(b"\0")
+
+    def flush_publishers(self):
+        """ Sends the due batches of the registered publishers. Returns the seconds until the next one is due """
+        next_due = None
+        for publisher in self.publishers:
+            due = publisher.flush_due()
+            if due is not None and (next_due is None or due < next_due):
+                next_due = due
+        return next_due
+
+    def poll(self, timeout=None):
+        """ Waits up to timeout seconds, forever if None, and handles the subscribers that received datagrams
+            and the publishers whose batches are due """
+        next_due = self.flush_publishers()
+        if next_due is not None and (timeout is None or next_due < timeout):
+            timeout = next_due
+        for key, _ in self.selector.select(timeout):
+            if key.data is None:
+                try:
+                    while self.wakeup_receiver.recv(64):
+                        pass
+                except BlockingIOError:
+                    pass
+            else:
+                key.data.on_readable()
+        if self.publishers:
+            self.flush_publishers()
+
+    def run(self):
+        while self.running:
+            self.poll()
+
+    def start(self):
+        """ Polls from a background thread until stop() """
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="UDPCommsPoller", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        self.selector.close()
+        self.wakeup_receiver.close()
+        self.wakeup_sender.close()
+
+
+# Shared memory slot of a local topic: a uint64 sequence number, odd while the publisher is
+# writing, then the payload size, crc32 of the payload and send time, then the latest payload.
+# The sequence number is stored and loaded as one aligned word through a memoryview, as
+# struct.pack_into clears its bytes before writing them.
+LOCAL_HEADER = struct.Struct("<IId")
+LOCAL_PAYLOAD = 8 + LOCAL_HEADER.size
+LOCAL_SLOT_SIZE = LOCAL_PAYLOAD + MAX_SIZE
+# Sequence number of a slot whose publisher unlinked it
+LOCAL_CLOSED = 2 ** 64 - 1
+
+
+def _local_name(port):
+    return "udpcomms_" + str(port)
+
+
+def _shared_memory(name, create=False, size=0):
+    """ Opens a shared memory segment without the resource tracker, which would unlink it when
+        this process exits even if the segment belongs to another process """
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name, create, size, track=False)
+    except TypeError:
+        pass
+    # Before Python 3.13 every SharedMemory registers the segment with the tracker
+    memory = shared_memory.SharedMemory(name, create, size)
+    if os.name == "posix":
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister("/" + memory.name, "shared_memory")
+    return memory
+
+
+def _unlink_shared_memory(memory):
+    if os.name == "posix" and not hasattr(memory, "_track"):
+        # Before Python 3.13 unlink() unregisters the segment, register it again to match
+        from multiprocessing import resource_tracker
+        resource_tracker.register("/" + memory.name, "shared_memory")
+    memory.unlink()
+
+
+def _open_shared_memory(port, create):
+    if create:
+        try:
+            return _shared_memory(_local_name(port), create=True, size=LOCAL_SLOT_SIZE)
+        except FileExistsError:
+            # Left by an earlier publisher of the topic that did not unlink it
+            pass
+    return _shared_memory(_local_name(port))
+
+
+class LocalPublisher:
+    """ Publisher for subscribers on the same host, through a shared memory slot instead of UDP
+
+    Same API as Publisher. Each message overwrites the slot under a seqlock, so sending is a copy
+    into memory without system calls. The topic is identified by the port number.
+
+    The publisher owns the slot: unlink() removes it and is called when the publisher is garbage
+    collected or leaves a with block. Subscribers then wait for the next publisher of the topic. """
+
+    memory = None
+
+    def __init__(self, port_tx, port=None, schema=None):
+        """ Create a LocalPublisher Object
 
         Arguments:
-            port         -- the port to listen to messages on
-            timeout      -- how long to wait before a message is considered out of date
+            port_tx      -- the topic, the port a UDP Publisher would send to
+            port         -- unused, for the same signature as Publisher
+            schema       -- encode messages in this Schema's binary layout instead of msgpack
         """
-        self.max_size = MAX_SIZE
+        self.schema = schema
+        self.memory = _open_shared_memory(port_tx, create=True)
+        self.slot = self.memory.buf
+        self.words = self.slot[:8].cast("Q")
+        self.sequence = self.words[0] & ~1
+        if self.words[0] == LOCAL_CLOSED:
+            # Left marked closed by a publisher whose unlink did not remove it. Clear the slot
+            # so subscribers still attached to it wait for this publisher's first message
+            self.sequence = 0
+            self.words[0] = 0
+            LOCAL_HEADER.pack_into(self.slot, 8, 0, 0, 0.0)
 
-        self.port = port
-        self.timeout = timeout
+    def send(self, obj):
+        """ Publish a message. The obj can be any nesting of standard python types,
+            or a dict with the schema's keys if the Publisher has a schema """
+        if self.schema is not None:
+            msg = self.schema.pack(obj)
+        else:
+            msg = msgpack.dumps(obj, use_bin_type=False)
+        size = len(msg)
+        assert size < MAX_SIZE, "Encoded message too big!"
+
+        self.sequence += 1
+        self.words[0] = self.sequence
+        self.slot[LOCAL_PAYLOAD:LOCAL_PAYLOAD + size] = msg
+        LOCAL_HEADER.pack_into(self.slot, 8, size, zlib.crc32(msg), monotonic())
+        self.sequence += 1
+        self.words[0] = self.sequence
+
+    def close(self):
+        """ Detaches from the slot without removing it, subscribers keep the latest message """
+        if self.memory is not None:
+            self.words.release()
+            self.slot.release()
+            self.memory.close()
+            self.memory = None
+
+    def unlink(self):
+        """ Removes the slot. Attached subscribers let go of it on their next read """
+        if self.memory is not None:
+            memory = self.memory
+            self.words[0] = LOCAL_CLOSED
+            self.close()
+            try:
+                _unlink_shared_memory(memory)
+            except FileNotFoundError:
+                # Removed by a newer publisher of the topic
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.unlink()
 
-        self.last_data = None
-        self.last_time = float('-inf')
+    def __del__(self):
+        self.unlink()
 
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # UDP
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        if hasattr(socket, "SO_REUSEPORT"):
-            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
-        self.sock.settimeout(timeout)
-        self.sock.bind(("", port))
+class LocalSubscriber:
+    """ Subscriber to a LocalPublisher on the same host. Same API as Subscriber
 
-    def recv(self):
-        """ Receive a single message from the socket buffer. It blocks for up to timeout seconds.
-        If no message is received before timeout it raises a UDPComms.timeout exception"""
+    Only the latest message is kept, get() copies and decodes it only when it changed. """
 
-        try:
-            self.last_data, address = self.sock.recvfrom(self.max_size)
-        except BlockingIOError:
-            raise socket.timeout("no messages in buffer and called with timeout = 0")
+    def __init__(self, port, timeout=0.2, retries=100):
+        """ Create a LocalSubscriber Object
 
+        Arguments:
+            port         -- the topic, the port a UDP Subscriber would listen to
+            timeout      -- how long to wait before a message is considered out of date
+            retries      -- reads attempted while the publisher is writing before giving up
+        """
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.memory = None
+        self.slot = None
+        self.words = None
+        self.buffer = bytearray(MAX_SIZE)
+        self.view = memoryview(self.buffer)
+        self.last_sequence = 0
+        self.last_size = 0
+        self.last_time = float('-inf')
+        self.latest = None
+        # Sequence numbers and send times come with every local message
+        self.stats = MessageStats()
+
+    @property
+    def last_data(self):
+        return bytes(self.view[:self.last_size])
+
+    def _read(self):
+        """ Copies a new message out of the slot. Returns False if there is none """
+        if self.slot is None:
+            try:
+                self.memory = _open_shared_memory(self.port, create=False)
+            except FileNotFoundError:
+                return False
+            self.slot = self.memory.buf
+            self.words = self.slot[:8].cast("Q")
+
+        for _ in range(self.retries):
+            sequence = self.words[0]
+            if sequence == self.last_sequence:
+                return False
+            if sequence == LOCAL_CLOSED:
+                # Attach to the next publisher's slot
+                self.close()
+                self.last_sequence = 0
+                return False
+            if sequence & 1:
+                continue
+            size, crc, send_time = LOCAL_HEADER.unpack_from(self.slot, 8)
+            if size == 0 or size > MAX_SIZE:
+                continue
+            self.view[:size] = self.slot[LOCAL_PAYLOAD:LOCAL_PAYLOAD + size]
+            # Python has no memory fences, the checksum catches reads the sequence check misses
+            if self.words[0] == sequence and zlib.crc32(self.view[:size]) == crc:
+                break
+        else:
+            return False
+
+        if sequence < self.last_sequence:
+            # The slot was created again since the last message
+            self.stats.reset()
+        self.stats.update(sequence // 2, send_time, monotonic())
+        self.last_sequence = sequence
+        self.last_size = size
         self.last_time = monotonic()
-        return msgpack.loads(self.last_data, raw=False)
+        self.latest = None
+        return True
+
+    def _decode(self):
+        if self.latest is None:
+            data = self.view[:self.last_size]
+            if data and data[0] == BINARY_MAGIC:
+                self.latest = decode_binary(data)
+            else:
+                self.latest = msgpack.loads(data, raw=False)
+        return self.latest
+
+    def recv(self):
+        """ Waits up to timeout seconds for a new message. Raises a UDPComms.timeout exception if none arrives """
+        deadline = monotonic() + self.timeout
+        while not self._read():
+            if monotonic() > deadline:
+                raise socket.timeout("no message received within timeout=" + str(self.timeout))
+            time.sleep(0.001)
+        return self._decode()
 
     def get(self):
-        """ Returns the latest message it can without blocking. If the latest massage is 
+        """ Returns the latest message without blocking. If the latest massage is
             older then timeout seconds it raises a UDPComms.timeout exception"""
-        try:
-            self.sock.settimeout(0)
-            while True:
-                self.last_data, address = self.sock.recvfrom(self.max_size)
-                self.last_time = monotonic()
-        except socket.error:
-            pass
-        finally:
-            self.sock.settimeout(self.timeout)
-
+        self._read()
         current_time = monotonic()
-        if (current_time - self.last_time) < self.timeout:
-            return msgpack.loads(self.last_data, raw=False)
-        else:
-            raise socket.timeout("timeout=" + str(self.timeout) + \
-                                 ", last message time=" + str(self.last_time) + \
-                                 ", current time=" + str(current_time))
+        if (current_time - self.stats.last_send_time) < self.timeout:
+            return self._decode()
+        raise socket.timeout("timeout=" + str(self.timeout) + \
+                             ", last message time=" + str(self.stats.last_send_time) + \
+                             ", current time=" + str(current_time))
 
     def get_list(self):
-        """ Returns list of messages, in the order they were received"""
-        msg_bufer = []
-        try:
-            self.sock.settimeout(0)
-            while True:
-                self.last_data, address = self.sock.recvfrom(self.max_size)
-                self.last_time = monotonic()
-                msg = msgpack.loads(self.last_data, raw=False)
-                msg_bufer.append(msg)
-        except socket.error:
-            pass
-        finally:
-            self.sock.settimeout(self.timeout)
-
-        return msg_bufer
+        """ Returns the new message in a list, or an empty list. The slot only keeps the latest message """
+        if self._read():
+            return [self._decode()]
+        return []
+
+    def close(self):
+        """ Detaches from the slot. Only the publisher removes it """
+        if self.memory is not None:
+            self.words.release()
+            self.slot.release()
+            self.memory.close()
+            self.memory = None
+            self.slot = None
+            self.words = None
 
     def __del__(self):
-        self.sock.close()
+        self.close()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,11 @@
 from .UDPComms import Publisher
 from .UDPComms import Subscriber
 from .UDPComms import timeout
+from .UDPComms import Schema
+from .UDPComms import StructMessage
+from .UDPComms import register_schema
+from .UDPComms import JOYSTICK_SCHEMA
+from .UDPComms import MessageStats
+from .UDPComms import Poller
+from .UDPComms import LocalPublisher
+from .UDPComms import LocalSubscriber
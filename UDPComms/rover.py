@@ -15,6 +15,8 @@ def peek_func(port):
     while 1:
         try:
             data = sub.recv()
+            if isinstance(data, UDPComms.StructMessage):
+                data = data.to_dict()
             print( json.dumps(data) )
         except UDPComms.timeout:
             exit()